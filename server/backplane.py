@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+# called in every server process with list of updated orders ({"orderId", "stoks", "quantity", "orderStatus"})
+UpdatesHandler = Callable[[List[dict]], None]
+# called when some updates of other processes were lost and will never be delivered
+GapHandler = Callable[[], None]
+# called in every server process with stoks whose positions changed, after the change is written
+PositionsHandler = Callable[[List[str]], None]
+# change stream can't be resumed: resume token is not in oplog anymore
+CHANGE_STREAM_HISTORY_LOST = 286
+# inserted orders and status changes, other updates of orders are not delivered to clients
+ORDER_CHANGES = [{"$match": {"$or": [
+    {"operationType": "insert"},
+    {"operationType": "update", "updateDescription.updatedFields.orderStatus": {"$exists": True}},
+]}}]
+POSITION_CHANGES = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+
+
+class LocalBackplane:
+    """
+    In-process backplane: updates published by this process are delivered only to this process.
+    Enough for single worker deployment and tests.
+    """
+    shared = False  # updates never come from other processes
+
+    def __init__(self):
+        self.handler: Optional[UpdatesHandler] = None
+        self.on_positions: Optional[PositionsHandler] = None
+
+    async def start(self, handler: UpdatesHandler, on_gap: Optional[GapHandler] = None,
+                    on_positions: Optional[PositionsHandler] = None) -> None:
+        self.handler = handler
+        self.on_positions = on_positions
+
+    async def stop(self) -> None:
+        self.handler = None
+        self.on_positions = None
+
+    async def publish(self, orders: List[dict]) -> None:
+        if self.handler:
+            self.handler(orders)
+
+    async def publish_positions(self, stoks: List[str]) -> None:
+        if self.on_positions:
+            self.on_positions(stoks)
+
+
+class MongoChangeStreamBackplane:
+    """
+    Backplane for several uvicorn workers / containers: every process watches change stream of orders collection,
+    so it hears about orders created and updated by any process. Requires MongoDB replica set.
+    Order is taken from change event (`updateLookup` for updates), so update of every order is delivered
+    as separate frame, batches are not preserved.
+    Changes of positions are heard from change stream of positions collection: position is written after its order,
+    so change of order is too early to read new position.
+    """
+    shared = True  # updates come from all processes
+
+    def __init__(self, collection, positions_collection=None, resume_delay: float = 1):
+        self.collection = collection
+        self.positions_collection = positions_collection
+        self.resume_delay = resume_delay
+        self.handler: Optional[UpdatesHandler] = None
+        self.on_gap: Optional[GapHandler] = None
+        self.on_positions: Optional[PositionsHandler] = None
+        self._watch_tasks: List[asyncio.Task] = []
+
+    async def start(self, handler: UpdatesHandler, on_gap: Optional[GapHandler] = None,
+                    on_positions: Optional[PositionsHandler] = None) -> None:
+        self.handler = handler
+        self.on_gap = on_gap
+        self.on_positions = on_positions
+        self._watch_tasks = [asyncio.create_task(self._watch("orders", self.collection, ORDER_CHANGES,
+                                                             self._deliver_order, on_gap),
+                                                 name="orders-change-stream")]
+        if on_positions and self.positions_collection is not None:
+            # positions aren't replayed, so lost changes need no resync, next change of stoks pushes it again
+            self._watch_tasks.append(asyncio.create_task(
+                self._watch("positions", self.positions_collection, POSITION_CHANGES, self._deliver_position),
+                name="positions-change-stream"))
+
+    async def stop(self) -> None:
+        for task in self._watch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._watch_tasks, return_exceptions=True)
+        self._watch_tasks = []
+        self.handler = None
+        self.on_positions = None
+
+    async def publish(self, orders: List[dict]) -> None:
+        """Nothing to do, write of order to db is the event"""
+
+    async def publish_positions(self, stoks: List[str]) -> None:
+        """Nothing to do, write of position to db is the event"""
+
+    def _deliver_order(self, order: dict) -> None:
+        self.handler([order])
+
+    def _deliver_position(self, position: dict) -> None:
+        self.on_positions([position["stoks"]])
+
+    async def _watch(self, name: str, collection, pipeline: list, deliver: Callable[[dict], None],
+                     on_gap: Optional[GapHandler] = None) -> None:
+        from pymongo.errors import PyMongoError  # pymongo is installed only with mongo storage
+
+        resume_token = None
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    LOGGER.info(f"watching {name} change stream")
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change.get("fullDocument")
+                        if not document:  # None when document was deleted before lookup
+                            continue
+                        try:
+                            deliver(document)
+                        except Exception as e:
+                            LOGGER.error(f"Failed to handle change of {name}: {e}")
+            except PyMongoError as e:
+                if getattr(e, "code", None) == CHANGE_STREAM_HISTORY_LOST:
+                    # resuming with the same token fails forever, updates since it are lost
+                    LOGGER.error(f"{name.capitalize()} change stream can't be resumed, watching from now on, "
+                                 f"changes in between are lost: {e}")
+                    resume_token = None
+                    if on_gap:
+                        on_gap()
+                    continue
+                LOGGER.error(f"{name.capitalize()} change stream failed, resuming in {self.resume_delay} sec: {e}")
+                await asyncio.sleep(self.resume_delay)
+
+
+def create_backplane(kind: str, repository, position_store=None):
+    """
+    :param kind: `local` or `mongo`
+    :param repository: orders storage, collection of mongo storage is watched by `mongo` backplane
+    :param position_store: positions view, its collection is watched by `mongo` backplane
+    """
+    if kind == "local":
+        return LocalBackplane()
+    if kind == "mongo":
+        if not hasattr(repository, "collection"):
+            raise ValueError("mongo backplane requires mongo storage")
+        return MongoChangeStreamBackplane(repository.collection, getattr(position_store, "collection", None))
+    raise ValueError(f"Unknown backplane: {kind}")
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket
+
+from serialization import JSON, JsonCodec, MsgpackCodec
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OverflowPolicy:
+    DROP_OLDEST = "drop_oldest"  # slow client loses oldest not yet sent messages
+    DROP_NEWEST = "drop_newest"  # slow client loses new messages until queue is drained
+    DISCONNECT = "disconnect"  # slow client is disconnected
+
+
+# fields of order update clients can subscribe to and name of the list in subscribe message,
+# `position` is not a field of order update - it is topic of position changes of stoks (`*` for all of them)
+SUBSCRIPTION_FIELDS = {"orderId": "orderIds", "stoks": "stoks", "orderStatus": "orderStatuses", "position": "positions"}
+
+
+def topic(field: str, value: str) -> str:
+    """Key of subscription index; ex 'stoks:EURUSD'"""
+    return f"{field}:{value}"
+
+
+class ClientConnection:
+    """WebSocket client with own bounded send queue drained by independent writer task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, codec: Union[JsonCodec, MsgpackCodec] = JSON):
+        self.websocket = websocket
+        self.codec = codec
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.writer_task = None
+        self.topics: Set[str] = set()
+        self.all_subscribed = False  # subscribed to all updates explicitly, kept when topics are added
+
+    async def writer(self, broadcaster: "Broadcaster") -> None:
+        try:
+            while True:
+                payload = await self.queue.get()
+                if self.codec.binary:
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOGGER.warning(f"WebSocket client disconnected: {e}")
+            broadcaster.discard(self.websocket)
+
+
+class Broadcaster:
+    """
+    Fan-out of messages to connected WebSocket clients.
+    Message is serialized once per format (json, msgpack) and the same payload is put into queues
+    of all recipients without awaiting, so publisher never waits for slow or stalled clients.
+    New clients get every message until they subscribe, then they get only messages matching any of their topics
+    (found through topic -> clients index) or every message if they subscribed to all of them.
+    Client that unsubscribed from everything gets nothing.
+    """
+
+    def __init__(self, queue_size: int = 1000, overflow_policy: str = OverflowPolicy.DROP_OLDEST):
+        if overflow_policy not in (OverflowPolicy.DROP_OLDEST, OverflowPolicy.DROP_NEWEST, OverflowPolicy.DISCONNECT):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.unfiltered_clients: Set[WebSocket] = set()
+        self.subscriptions: Dict[str, Set[WebSocket]] = {}
+        self._close_tasks = set()
+
+    def register(self, websocket: WebSocket, codec: Union[JsonCodec, MsgpackCodec] = JSON) -> ClientConnection:
+        client = ClientConnection(websocket, self.queue_size, codec)
+        client.writer_task = asyncio.create_task(client.writer(self))
+        self.clients[websocket] = client
+        self.unfiltered_clients.add(websocket)
+        return client
+
+    def discard(self, websocket: WebSocket) -> None:
+        """Forget client and stop its writer, safe to call several times"""
+        client = self.clients.pop(websocket, None)
+        if not client:
+            return
+        self.unfiltered_clients.discard(websocket)
+        self._remove_from_index(websocket, client.topics)
+        if client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str], all_updates: bool = False) -> Optional[Set[str]]:
+        """
+        Add topics to client subscription, with `all_updates` client gets every message.
+        :return: all client topics, None for client that is disconnected already
+        """
+        client = self.clients.get(websocket)
+        if not client:
+            return None
+        for new_topic in set(topics) - client.topics:
+            self.subscriptions.setdefault(new_topic, set()).add(websocket)
+            client.topics.add(new_topic)
+        if all_updates:
+            client.all_subscribed = True
+            self.unfiltered_clients.add(websocket)
+        elif client.topics and not client.all_subscribed:
+            self.unfiltered_clients.discard(websocket)
+        return client.topics
+
+    def unsubscribe(self, websocket: WebSocket, topics: Optional[Iterable[str]] = None,
+                    all_updates: bool = False) -> Optional[Set[str]]:
+        """
+        Remove given topics (all of them and subscription to all updates when None) from client subscription,
+        with `all_updates` client stops getting every message.
+        :return: remaining client topics, None for client that is disconnected already
+        """
+        client = self.clients.get(websocket)
+        if not client:
+            return None
+        removed = client.topics.copy() if topics is None else client.topics & set(topics)
+        self._remove_from_index(websocket, removed)
+        client.topics -= removed
+        if topics is None or all_updates:
+            client.all_subscribed = False
+            self.unfiltered_clients.discard(websocket)
+        return client.topics
+
+    def is_subscribed_to_all(self, websocket: WebSocket) -> bool:
+        return websocket in self.unfiltered_clients
+
+    def _remove_from_index(self, websocket: WebSocket, topics: Iterable[str]) -> None:
+        for old_topic in topics:
+            subscribers = self.subscriptions.get(old_topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscriptions[old_topic]
+
+    async def disconnect(self, websocket: WebSocket, code: int = 1008, reason: str = "") -> None:
+        self.discard(websocket)
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception as e:
+            LOGGER.warning(f"Failed to close WebSocket client: {e}")
+
+    def publish(self, message: Any, topics: Optional[Iterable[str]] = None, subscribers_only: bool = False) -> int:
+        """
+        Serialize message once per format and enqueue it for interested clients.
+        :param message: json serializable message
+        :param topics: topics of message; None means message goes to every client
+        :param subscribers_only: message goes only to clients subscribed to its topics, not to clients without subscriptions
+        :return: number of clients message was sent to
+        """
+        payloads = {}  # codec name -> encoded message
+        recipients = self.recipients(topics, subscribers_only)
+        for websocket in recipients:
+            client = self.clients.get(websocket)
+            if not client:  # could be disconnected by overflow policy during this loop
+                continue
+            payload = payloads.get(client.codec.name)
+            if payload is None:
+                payload = payloads[client.codec.name] = client.codec.encode(message)
+            self._enqueue(websocket, client, payload)
+        return len(recipients)
+
+    def recipients(self, topics: Optional[Iterable[str]] = None, subscribers_only: bool = False) -> Set[WebSocket]:
+        if topics is None:
+            return set(self.clients)
+        recipients = set() if subscribers_only else set(self.unfiltered_clients)
+        for message_topic in topics:
+            recipients |= self.subscriptions.get(message_topic, set())
+        return recipients
+
+    def has_subscribers(self, topics: Iterable[str]) -> bool:
+        return any(self.subscriptions.get(message_topic) for message_topic in topics)
+
+    def is_interested(self, websocket: WebSocket, topics: Iterable[str]) -> bool:
+        return websocket in self.unfiltered_clients or \
+            (websocket in self.clients and not self.clients[websocket].topics.isdisjoint(topics))
+
+    def publish_batch(self, messages: List[Tuple[dict, Iterable[str]]]) -> int:
+        """
+        Send several messages as one frame (list of messages) per client.
+        Every client gets only messages it is subscribed to, clients without subscriptions share one serialized frame.
+        :param messages: list of (message, topics of message)
+        :return: number of clients frame was sent to
+        """
+        per_client: Dict[WebSocket, list] = {}
+        for message, message_topics in messages:
+            for websocket in self.recipients(message_topics) - self.unfiltered_clients:
+                per_client.setdefault(websocket, []).append(message)
+
+        recipients_count = 0
+        if self.unfiltered_clients:
+            recipients_count = self.publish([message for message, _ in messages], topics=[])  # no topics - unfiltered only
+        for websocket, client_messages in per_client.items():
+            self.send(websocket, client_messages)
+        return recipients_count + len(per_client)
+
+    def free_space(self, websocket: WebSocket) -> int:
+        """Number of messages that can be enqueued for client without overflow, 0 for unknown client"""
+        client = self.clients.get(websocket)
+        return client.queue.maxsize - client.queue.qsize() if client else 0
+
+    def send(self, websocket: WebSocket, message: Any) -> None:
+        """Enqueue message for one client, keeps order with broadcasted messages"""
+        client = self.clients.get(websocket)
+        if client:
+            self._enqueue(websocket, client, client.codec.encode(message))
+
+    def _enqueue(self, websocket: WebSocket, client: ClientConnection, payload: Union[str, bytes]) -> None:
+        try:
+            client.queue.put_nowait(payload)
+            return
+        except asyncio.QueueFull:
+            client.dropped += 1
+
+        if self.overflow_policy == OverflowPolicy.DISCONNECT:
+            LOGGER.warning(f"WebSocket client send queue overflow ({self.queue_size}), disconnecting")
+            self.discard(websocket)
+            close_task = asyncio.create_task(self.disconnect(websocket, code=1013, reason="send queue overflow"))
+            self._close_tasks.add(close_task)
+            close_task.add_done_callback(self._close_tasks.discard)
+        elif self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+            client.queue.get_nowait()
+            client.queue.put_nowait(payload)
+
+    @property
+    def client_count(self) -> int:
+        return len(self.clients)
+
+    def queue_depths(self) -> list:
+        return [client.queue.qsize() for client in self.clients.values()]
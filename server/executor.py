@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OrderExecutor:
+    """
+    Bounded pool of workers executing orders from a bounded queue.
+    `submit` waits when queue is full, so producers are slowed down instead of piling up tasks.
+    """
+
+    def __init__(self, process: Callable[[str], Awaitable[None]], workers: int = 200, queue_size: int = 10000):
+        self.process = process
+        self.workers_count = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.queue_size = queue_size
+        self.workers = []
+        self.in_progress = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)  # new queue bound to running event loop
+        self.workers = [asyncio.create_task(self._worker(), name=f"order-executor-{i}")
+                        for i in range(self.workers_count)]
+        LOGGER.info(f"order executor started with {self.workers_count} workers")
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        LOGGER.info(f"order executor stopped, {self.queue.qsize()} orders left in queue")
+
+    async def submit(self, order_id: str) -> None:
+        await self.queue.put(order_id)
+
+    async def _worker(self) -> None:
+        while True:
+            order_id = await self.queue.get()
+            self.in_progress += 1
+            try:
+                await self.process(order_id)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                LOGGER.error(f"Failed to process order {order_id}: {e}")
+            finally:
+                self.in_progress -= 1
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers_count,
+            "queueSize": self.queue_size,
+            "queueDepth": self.queue.qsize(),
+            "inProgress": self.in_progress,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
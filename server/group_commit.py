@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# writes list of operations at once, returns result of every operation (exception instance for failed one)
+GroupWriter = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class GroupCommitter:
+    """
+    Coalesces write operations of concurrent requests into groups written at once:
+    group is flushed `window` seconds after its first operation or when it has `max_operations`.
+    Caller of `submit` gets result of own operation only after the whole group is written,
+    so nothing is announced (broadcasted) before its write is acknowledged.
+    Several groups can be written concurrently.
+    """
+
+    def __init__(self, write: GroupWriter, window: float = 0.002, max_operations: int = 500):
+        self.write = write
+        self.window = window
+        self.max_operations = max_operations
+        self.pending: List[Tuple[Any, asyncio.Future]] = []
+        self.groups = 0
+        self.operations = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    async def submit(self, operation: Any) -> Any:
+        """Buffer operation, returns its result or raises its error when its group is written"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((operation, future))
+        if len(self.pending) >= self.max_operations:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Start writing buffered operations as one group"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        group, self.pending = self.pending, []
+        if group:
+            task = asyncio.create_task(self._write_group(group))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write_group(self, group: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.groups += 1
+        self.operations += len(group)
+        try:
+            results = await self.write([operation for operation, _ in group])
+        except Exception as e:  # whole group failed, every caller gets the error
+            LOGGER.error(f"Failed to write group of {len(group)} operations: {e!r}")
+            results = [e] * len(group)
+        for (_, future), result in zip(group, results):
+            if future.done():  # caller was cancelled
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """Write everything buffered and wait for groups being written"""
+        self.flush()
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"window": self.window, "maxOperations": self.max_operations, "groups": self.groups,
+                "operations": self.operations, "pending": len(self.pending)}
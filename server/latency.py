@@ -0,0 +1,67 @@
+import asyncio
+import random
+from typing import Optional
+
+
+class LatencyProfile:
+    """
+    Simulated latency, described by spec string:
+    `off` - no delay
+    `fixed:<sec>` - always the same delay
+    `uniform:<min sec>:<max sec>` - uniformly distributed delay
+    `lognormal:<mu>:<sigma>` - log-normally distributed delay (in seconds), long tail like real services
+    Delays are taken from own random generator, so the same seed gives the same sequence of delays.
+    """
+    KINDS = {"off": 0, "fixed": 1, "uniform": 2, "lognormal": 2}  # kind -> number of params
+
+    def __init__(self, spec: str, seed: Optional[str] = None):
+        kind, *params = spec.strip().split(":")
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency profile '{spec}', expected one of: off, fixed:<sec>, "
+                             f"uniform:<min sec>:<max sec>, lognormal:<mu>:<sigma>")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        self.random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.kind == "off":
+            return 0
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.random.uniform(*self.params)
+        return self.random.lognormvariate(*self.params)
+
+    async def sleep(self) -> float:
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class LatencyProfiles:
+    """
+    Latency profiles of routes and order execution, configured with environment variables:
+    LATENCY_PROFILE - default profile of routes
+    LATENCY_PROFILE_<ROUTE NAME> - profile of one route; ex LATENCY_PROFILE_GET_ORDERS=off
+    EXECUTION_LATENCY_PROFILE - profile of order execution
+    LATENCY_SEED - seed of random delays, every profile gets own generator seeded with it and its name
+    """
+
+    def __init__(self, environ: dict, default_route_spec: str = "uniform:0.1:1",
+                 default_execution_spec: str = "uniform:0.5:2"):
+        self.environ = environ
+        self.seed = environ.get("LATENCY_SEED")
+        self.default_route_spec = environ.get("LATENCY_PROFILE", default_route_spec)
+        self.execution = self._profile("execution", environ.get("EXECUTION_LATENCY_PROFILE", default_execution_spec))
+        self.routes = {}
+
+    def _profile(self, name: str, spec: str) -> LatencyProfile:
+        return LatencyProfile(spec, seed=f"{self.seed}:{name}" if self.seed is not None else None)
+
+    def for_route(self, route: str) -> LatencyProfile:
+        if route not in self.routes:
+            spec = self.environ.get(f"LATENCY_PROFILE_{route.upper()}", self.default_route_spec)
+            self.routes[route] = self._profile(route, spec)
+        return self.routes[route]
@@ -1,38 +1,145 @@
-from fastapi import FastAPI, WebSocket, HTTPException, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Query, Request, Body, Header
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Union
 from uuid import uuid4
 import asyncio
-import random
-from pydantic import BaseModel, Field
-from motor.motor_asyncio import AsyncIOMotorClient
+import os
+import time
+from pydantic import BaseModel, Field, ValidationError
+from contextlib import asynccontextmanager
+from executor import OrderExecutor
+from backplane import create_backplane
+from latency import LatencyProfiles
+from metrics import MetricsRegistry, RequestMetricsMiddleware
+from order_cache import OrderCache
+from replay import ReplayBuffer
+from order_state import OrderStatus, OrderNotFound, InvalidTransition, transition
+from positions import PositionChange, PositionPublisher, create_position_store, serialize_position
+from storage import TimedOrderRepository, as_utc, create_repository
+from serialization import JSON, dumps, negotiate_codec
+from broadcaster import Broadcaster, OverflowPolicy, SUBSCRIPTION_FIELDS, topic
 import logging
 
 LOGGER = logging.getLogger(__name__)
 
-class OrderStatus:
-    PENDING = "pending"
-    EXECUTED = "executed"
-    CANCELED = "canceled"
+metrics = MetricsRegistry()
+request_duration = metrics.histogram("http_request_duration_seconds",
+                                     "Duration of HTTP requests, including simulated delay", ("method", "route", "status"))
+request_delay = metrics.histogram("http_request_simulated_delay_seconds",
+                                  "Simulated delay (short_delay) part of HTTP request duration", ("route",))
+storage_duration = metrics.histogram("storage_operation_duration_seconds", "Duration of order storage operations",
+                                     ("operation",))
+broadcast_duration = metrics.histogram("broadcast_fanout_duration_seconds",
+                                       "Time to serialize order updates and enqueue them for WebSocket clients")
+broadcast_recipients = metrics.histogram("broadcast_recipients", "Number of WebSocket clients order update is sent to",
+                                         buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+execution_latency = metrics.histogram("order_create_to_executed_seconds", "Time from order creation to its execution",
+                                      buckets=(0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 10, 30, 60, 300))
+position_update_failures = metrics.counter("positions_view_update_failures_total",
+                                          "Order changes not applied to positions view, fixed by rebuild of view")
 
+STORAGE = os.getenv("STORAGE", "mongo")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017/trading")
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "100"))
+MONGO_POOL_WARMUP = int(os.getenv("MONGO_POOL_WARMUP", "10"))
+WRITE_COALESCE_WINDOW_MS = float(os.getenv("WRITE_COALESCE_WINDOW_MS", "2"))
+WRITE_COALESCE_MAX_OPS = int(os.getenv("WRITE_COALESCE_MAX_OPS", "500"))
+# nothing is connected here, storage is started in lifespan
+orders_repository = TimedOrderRepository(create_repository(STORAGE, MONGO_URI, pool_size=MONGO_POOL_SIZE,
+                                                           warmup_connections=MONGO_POOL_WARMUP,
+                                                           write_window=WRITE_COALESCE_WINDOW_MS / 1000,
+                                                           write_group_size=WRITE_COALESCE_MAX_OPS), storage_duration)
+position_store = create_position_store(STORAGE, orders_repository, write_window=WRITE_COALESCE_WINDOW_MS / 1000,
+                                       write_group_size=WRITE_COALESCE_MAX_OPS)
 
-MONGO_URI = "mongodb://mongo:27017/trading"  #  not very dynamic but for this project - ok
-client = AsyncIOMotorClient(MONGO_URI)
-db = client.trading
-orders_collection = db.orders
-orders_collection.create_index([("orderId", 1)], unique=True)
+ORDERS_PAGE_MAX_LIMIT = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "1000"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", OverflowPolicy.DROP_OLDEST)
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "10000"))
+
+ORDERS_BATCH_MAX_SIZE = int(os.getenv("ORDERS_BATCH_MAX_SIZE", "1000"))
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "10000"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "60"))
+BROADCAST_BACKPLANE = os.getenv("BROADCAST_BACKPLANE", "local")
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "200"))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", "10000"))
+POSITIONS_REBUILD_ON_START = os.getenv("POSITIONS_REBUILD_ON_START", "false").lower() == "true"
+
+broadcaster = Broadcaster(queue_size=WS_CLIENT_QUEUE_SIZE, overflow_policy=WS_OVERFLOW_POLICY)
+replay_buffer = ReplayBuffer(size=WS_REPLAY_BUFFER_SIZE)
+latency_profiles = LatencyProfiles(os.environ)
+order_cache = OrderCache(max_size=ORDER_CACHE_SIZE, ttl=ORDER_CACHE_TTL)
+backplane = create_backplane(BROADCAST_BACKPLANE, orders_repository, position_store)
+ALL_POSITIONS_TOPIC = topic("position", "*")
+position_publisher = PositionPublisher(position_store, lambda position: broadcaster.publish(
+    {"position": serialize_position(position)}, [topic("position", position["stoks"]), ALL_POSITIONS_TOPIC],
+    subscribers_only=True))
+
+metrics.gauge("websocket_clients", "Number of connected WebSocket clients", lambda: broadcaster.client_count)
+metrics.gauge("websocket_send_queue_depth", "Messages waiting to be sent to all WebSocket clients",
+              lambda: sum(broadcaster.queue_depths()))
+metrics.gauge("order_executor_queue_depth", "Orders waiting for execution", lambda: executor.queue.qsize())
+metrics.gauge("order_executor_in_progress", "Orders being executed", lambda: executor.in_progress)
+
+
+async def requeue_pending_orders(started_at: datetime) -> None:
+    """
+    Orders left pending by previous run (restart, crash) are sent to execution again.
+    Orders created since `started_at` are submitted by create_order already, they are not scanned.
+    """
+    count = 0
+    async for order_id in orders_repository.iter_order_ids(OrderStatus.PENDING, created_before=started_at):
+        await executor.submit(order_id)
+        count += 1
+    LOGGER.info(f"{count} pending orders re-enqueued for execution")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Everything is ready (indexes built, connections opened) before first request, `/ready` tells it to probes"""
+    app.state.ready = False
+    started_at = datetime.now(timezone.utc)
+    await orders_repository.start()
+    if POSITIONS_REBUILD_ON_START:
+        await position_store.rebuild(orders_repository)
+    else:
+        await position_store.initialize(orders_repository)
+    await backplane.start(deliver_order_updates, on_gap=resync_clients, on_positions=deliver_position_changes)
+    await executor.start()
+    requeue_task = asyncio.create_task(requeue_pending_orders(started_at))
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    requeue_task.cancel()
+    await executor.stop()
+    await backplane.stop()
+    await position_publisher.stop()
+    await position_store.close()
+    await orders_repository.close()
 
-websocket_clients = set()
 
 app = FastAPI(
     title="Trading Platform API",
     description="Sample RESTful API server that exposes a set of endpoints to simulate a trading platform.",
-    version="1"
+    version="1",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # order endpoints return it themselves to skip generic encoder
 )
+app.add_middleware(RequestMetricsMiddleware, histogram=request_duration, skip_paths=["/metrics", "/ready"])
 
-async def short_delay():
+def short_delay(route: str):
     """
-    short delay for simulation of processing request
+    short delay for simulation of processing request, taken from latency profile of route
+    `route` is name of route function, so delay and request duration metrics have the same route label
     """
-    await asyncio.sleep(random.uniform(0.1, 1))
+    profile = latency_profiles.for_route(route)
+
+    async def delay():
+        request_delay.observe(await profile.sleep(), route)
+    return delay
 
 
 class CreateOrderRequest(BaseModel):
@@ -41,74 +148,422 @@ class CreateOrderRequest(BaseModel):
     quantity: float = Field(gt=0, description="Quantity must be greater than zero")
 
 
-async def broadcast_order_update(order_id: str, order_status: str):
-    """Broadcast order status update to all connected WebSocket clients"""
-    update = {"orderId": order_id, "orderStatus": order_status}
-    for client in websocket_clients.copy():
+def order_update_topics(order_id: str, order_status: str, stoks: Optional[str] = None) -> list:
+    topics = [topic("orderId", order_id), topic("orderStatus", order_status)]
+    if stoks is not None:
+        topics.append(topic("stoks", stoks))
+    return topics
+
+
+def deliver_order_updates(orders: List[dict]) -> None:
+    """
+    Called by backplane in every server process for every published update.
+    Numbers updates with sequence numbers of this process (`seq`) and remembers them for replay.
+    Sends update to subscribed WebSocket clients of this process, never waits for clients.
+    Several orders are sent as one WebSocket frame (json list of updates).
+    """
+    if backplane.shared:  # order could be changed by other process, cached copy is outdated
+        for order in orders:
+            order_cache.invalidate(order["orderId"])
+
+    start = time.perf_counter()
+    updates = []
+    for order in orders:
+        topics = order_update_topics(order["orderId"], order["orderStatus"], order["stoks"])
+        updates.append((replay_buffer.record({"orderId": order["orderId"], "orderStatus": order["orderStatus"]}, topics),
+                        topics))
+    if len(updates) == 1:
+        recipients = broadcaster.publish(*updates[0])
+    else:
+        recipients = broadcaster.publish_batch(updates)
+    broadcast_duration.observe(time.perf_counter() - start)
+    broadcast_recipients.observe(recipients)
+
+
+def deliver_position_changes(stoks: List[str]) -> None:
+    """
+    Called by backplane in every server process after positions of stoks changed in view.
+    Positions are pushed only to clients subscribed to them, read of position is done only for them.
+    """
+    position_publisher.mark_changed(changed for changed in stoks
+                                    if broadcaster.has_subscribers([topic("position", changed), ALL_POSITIONS_TOPIC]))
+
+
+def resync_clients() -> None:
+    """
+    Called by backplane when updates of other processes were lost: they can't be replayed and cached orders
+    could be outdated. New replay stream makes resuming clients resync, connected clients are told to resync now.
+    """
+    replay_buffer.reset()
+    order_cache.clear()
+    broadcaster.publish({"action": "resync", "streamId": replay_buffer.stream_id, "seq": replay_buffer.seq})
+
+
+async def apply_position_changes(changes: List[PositionChange]) -> None:
+    """
+    Update positions view after orders are written. Orders are stored already, so failed view update
+    must not stop their execution, caching or broadcast: it is logged and counted, rebuild of view fixes it.
+    """
+    try:
+        await position_store.apply(changes)
+    except Exception as e:
+        position_update_failures.inc(len(changes))
+        LOGGER.error(f"Failed to apply {len(changes)} order changes to positions view: {e!r}")
+        return
+    await backplane.publish_positions(sorted({stoks for stoks, _, _, _ in changes}))
+
+
+async def broadcast_order_update(order: dict):
+    """Broadcast order status update to WebSocket clients of all server processes"""
+    await backplane.publish([order])
+
+
+async def broadcast_order_updates_batch(orders: List[dict]):
+    """Broadcast status updates of several orders to WebSocket clients of all server processes as one frame"""
+    await backplane.publish(orders)
+
+
+def handle_websocket_message(websocket: WebSocket, raw_message: Union[str, bytes]) -> None:
+    """
+    Handle subscription message from WebSocket client (json text or, for msgpack clients, msgpack binary); ex
+    {"action": "subscribe", "stoks": ["EURUSD"], "orderIds": ["..."], "orderStatuses": ["executed"]}
+    {"action": "unsubscribe", "stoks": ["EURUSD"]}  # without lists - unsubscribe from everything
+    {"action": "subscribe", "all": true}  # all order updates, {"action": "unsubscribe", "all": true} stops them
+    {"action": "subscribe", "positions": ["EURUSD"]}  # position changes of stoks, "*" - of all stoks
+    {"action": "resume", "lastSeq": 41, "streamId": "..."}  # see resume_updates
+    Client receives update if it matches any of subscribed values or it is subscribed to all updates.
+    New client receives all updates until it subscribes, client unsubscribed from everything receives nothing.
+    """
+    client = broadcaster.clients.get(websocket)
+    codec = client.codec if client else JSON
+    try:
+        message = codec.decode(raw_message)
+        action = message["action"]
+    except Exception:  # any garbage could be sent, decoders raise different errors
+        broadcaster.send(websocket, {"error": f"Invalid message: {raw_message!s}"})
+        return
+    for key in SUBSCRIPTION_FIELDS.values():
+        # string would be iterated by characters; ex "EURUSD" subscribes to E, U, R, S, D
+        values = message.get(key, [])
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            broadcaster.send(websocket, {"error": f"Invalid {key}: list of strings expected"})
+            return
+    all_updates = message.get("all", False)
+    if not isinstance(all_updates, bool):
+        broadcaster.send(websocket, {"error": "Invalid all: boolean expected"})
+        return
+    topics = [topic(field, value) for field, key in SUBSCRIPTION_FIELDS.items() for value in message.get(key, [])]
+
+    if action == "resume":
+        resume_updates(websocket, message.get("lastSeq"), message.get("streamId"))
+        return
+    if action == "subscribe":
+        current_topics = broadcaster.subscribe(websocket, topics, all_updates)
+    elif action == "unsubscribe":
+        everything = not topics and not all_updates  # message without lists and `all`
+        current_topics = broadcaster.unsubscribe(websocket, None if everything else topics, all_updates)
+    else:
+        broadcaster.send(websocket, {"error": f"Unknown action: {action}"})
+        return
+    if current_topics is None:  # disconnected by overflow policy while its message was waiting
+        return
+
+    subscription = {key: [] for key in SUBSCRIPTION_FIELDS.values()}
+    for current_topic in sorted(current_topics):
+        field, value = current_topic.split(":", 1)
+        subscription[SUBSCRIPTION_FIELDS[field]].append(value)
+    broadcaster.send(websocket, {"action": f"{action}d", "all": broadcaster.is_subscribed_to_all(websocket), **subscription})
+
+
+def resume_updates(websocket: WebSocket, last_seq: Optional[int], stream_id: Optional[str]) -> None:
+    """
+    Replay updates (matching client subscription) that reconnected client missed after `last_seq`.
+    Reply is {"action": "resumed", "streamId": ..., "seq": current seq, "replayed": N} followed by N updates,
+    or {"action": "resync", "streamId": ..., "seq": current seq} when missed updates are not known anymore
+    (too old, `streamId` is from other server process or more of them than fits client send queue) -
+    client has to reload orders with GET /orders.
+    Without `lastSeq` client just gets current `streamId` and `seq`.
+    Everything is enqueued without awaiting, so no live update gets in between or is lost.
+    """
+    state = {"streamId": replay_buffer.stream_id, "seq": replay_buffer.seq}
+    if last_seq is None:
+        broadcaster.send(websocket, {"action": "resumed", **state, "replayed": 0})
+        return
+    if not isinstance(last_seq, int) or isinstance(last_seq, bool):
+        broadcaster.send(websocket, {"error": f"Invalid lastSeq: {last_seq}"})
+        return
+
+    missed = replay_buffer.since(last_seq) if stream_id in (None, replay_buffer.stream_id) else None
+    if missed is None:
+        broadcaster.send(websocket, {"action": "resync", **state})
+        return
+    missed = [update for update, topics in missed if broadcaster.is_interested(websocket, topics)]
+    if len(missed) + 1 > broadcaster.free_space(websocket):
+        # overflow policy would drop replayed updates without notice or disconnect client in the middle of resume
+        broadcaster.send(websocket, {"action": "resync", **state})
+        return
+    broadcaster.send(websocket, {"action": "resumed", **state, "replayed": len(missed)})
+    for update in missed:
+        broadcaster.send(websocket, update)
+
+
+def serialize_order(order: dict) -> dict:
+    """Convert order from storage to API representation"""
+    serialized = {"orderId": str(order["orderId"]), "stoks": order['stoks'], "quantity": order['quantity'],
+                  "orderStatus": order['orderStatus']}
+    if "createdAt" in order:  # orders created before timestamps were added don't have it
+        serialized["createdAt"] = as_utc(order["createdAt"]).isoformat(timespec="milliseconds")
+    return serialized
+
+
+def order_etag(order_id: str, version: int) -> str:
+    """ETag of order, its version is incremented by every status change"""
+    return f'"{order_id}-{version}"'
+
+
+def orders_etag() -> str:
+    """
+    ETag of orders list: number of order updates (creates and status changes) this process delivered,
+    the same counter numbers WebSocket updates (`seq`). With shared backplane it counts updates of all processes.
+    """
+    return f'"{replay_buffer.stream_id}-{replay_buffer.seq}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """`If-None-Match` has given ETag, weak comparison as GET needs"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def new_order_document(order: CreateOrderRequest) -> dict:
+    now = datetime.now(timezone.utc)
+    return {"orderId": str(uuid4()), "stoks": order.stoks, "quantity": order.quantity,
+            "orderStatus": OrderStatus.PENDING, "version": 1,
+            "createdAt": now.replace(microsecond=now.microsecond // 1000 * 1000)}  # mongo keeps milliseconds
+
+
+async def stream_orders_ndjson(orders):
+    """Yield orders one per line as soon as storage returns them, nothing is accumulated in memory"""
+    async for order in orders:
+        yield dumps(serialize_order(order)) + b"\n"
+
+
+async def stream_orders_json(orders):
+    """Yield json array of orders element by element, the same body as serialized list without holding it in memory"""
+    separator = b"["
+    async for order in orders:
+        yield separator + dumps(serialize_order(order))
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+@app.get("/orders", status_code=200, dependencies=[Depends(short_delay("get_orders"))])
+async def get_orders(request: Request,
+                     limit: Optional[int] = Query(None, gt=0, le=ORDERS_PAGE_MAX_LIMIT,
+                                                  description="Page size, enables keyset pagination by orderId"),
+                     after: Optional[str] = Query(None, description="orderId of the last order from previous page"),
+                     status: Optional[str] = Query(None, description="Only orders with this status"),
+                     stoks: Optional[str] = Query(None, description="Only orders with this stoks"),
+                     created_from: Optional[datetime] = Query(None, alias="createdFrom",
+                                                              description="Only orders created at this moment or later"),
+                     created_to: Optional[datetime] = Query(None, alias="createdTo",
+                                                            description="Only orders created before this moment")):
+    """
+    Without params returns all orders (as before), streamed as json array straight from storage.
+    `status`, `stoks`, `createdFrom`, `createdTo` filter orders, can be combined with pagination.
+    With `limit` returns one page sorted by orderId, `X-Next-Cursor` header holds value for `after` of next page.
+    With `Accept: application/x-ndjson` orders are streamed line by line straight from storage.
+    Json response has `ETag` changed by every order update, with `If-None-Match` of current ETag
+    304 is returned without reading storage.
+    """
+    orders = orders_repository.iter_orders(after=after, limit=limit, status=status, stoks=stoks,
+                                           created_from=created_from, created_to=created_to)
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(stream_orders_ndjson(orders), media_type=NDJSON_MEDIA_TYPE)
+
+    etag = orders_etag()  # taken before reading, so update made during read gives new ETag next time
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"ETag": etag}
+    if limit is None:  # unbounded result is never collected, memory doesn't grow with collection
+        return StreamingResponse(stream_orders_json(orders), media_type="application/json", headers=headers)
+    orders = [serialize_order(order) async for order in orders]  # one page of at most ORDERS_PAGE_MAX_LIMIT
+    if limit is not None and len(orders) == limit:
+        headers["X-Next-Cursor"] = orders[-1]["orderId"]
+    return ORJSONResponse(orders, headers=headers)
+
+
+@app.post("/orders", status_code=201, dependencies=[Depends(short_delay("create_order"))])
+async def create_order(order: CreateOrderRequest) -> ORJSONResponse:
+    new_order = new_order_document(order)
+    await orders_repository.insert(new_order)
+    await apply_position_changes([(new_order["stoks"], new_order["quantity"], None, OrderStatus.PENDING)])
+    created_order = serialize_order(new_order)
+    order_cache.put(created_order, new_order["version"])
+    await broadcast_order_update(created_order)
+    await executor.submit(new_order["orderId"])
+    return ORJSONResponse(created_order, status_code=201,
+                          headers={"ETag": order_etag(new_order["orderId"], new_order["version"])})
+
+
+@app.post("/orders/batch", status_code=200, dependencies=[Depends(short_delay("create_orders_batch"))])
+async def create_orders_batch(orders: List[Any] = Body(..., min_length=1, max_length=ORDERS_BATCH_MAX_SIZE)) -> ORJSONResponse:
+    """
+    Create several orders with one db write and one WebSocket frame.
+    Every item is validated separately, response has result for every item in the same order:
+    created order or {"error": [validation errors]}.
+    """
+    results: List[dict] = []
+    new_orders = []
+    for item in orders:
         try:
-            await client.send_json(update)
-        except (ConnectionResetError, asyncio.CancelledError) as e:
-            LOGGER.warning(f"WebSocket client disconnected: {e}")
-            websocket_clients.remove(client)
-        except Exception as e:
-            logging.error(f"Unexpected error during sending WebSocket message: {e}")
-            websocket_clients.remove(client)
-            raise
-
-
-@app.get("/orders", status_code=200, dependencies=[Depends(short_delay)])
-async def get_orders() -> list:
-    orders = await orders_collection.find().to_list(length=None)
-    return [{"orderId": str(order["orderId"]), "stoks": order['stoks'], "quantity": order['quantity'],
-             "orderStatus": order['orderStatus']} for order in orders]
-
-
-@app.post("/orders", status_code=201, dependencies=[Depends(short_delay)])
-async def create_order(order: CreateOrderRequest) -> dict:
-    order_id = str(uuid4())
-    new_order = {"orderId": order_id, "stoks": order.stoks, "quantity": order.quantity,
-                 "orderStatus": OrderStatus.PENDING}
-    await orders_collection.insert_one(new_order)
-    await broadcast_order_update(order_id, OrderStatus.PENDING)
-    asyncio.create_task(process_order(order_id))
-    return {"orderId": order_id, "stoks": order.stoks, "quantity": order.quantity, "orderStatus": OrderStatus.PENDING}
-
-
-@app.get("/orders/{order_id}", status_code=200, dependencies=[Depends(short_delay)])
-async def get_order(order_id: str) -> dict:
-    order = await orders_collection.find_one({"orderId": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    return {"orderId": order_id, "stoks": order['stoks'], "quantity": order['quantity'],
-            "orderStatus": order['orderStatus']}
+            order = CreateOrderRequest.model_validate(item)
+        except ValidationError as e:
+            results.append({"error": e.errors(include_url=False, include_context=False)})
+            continue
+        new_order = new_order_document(order)
+        results.append(serialize_order(new_order))
+        new_orders.append(new_order)
+
+    if not new_orders:
+        return ORJSONResponse(results)
+
+    failed_indexes = await orders_repository.insert_many(new_orders)
+    failed_ids = {new_orders[index]["orderId"] for index in failed_indexes}
+    if failed_ids:
+        LOGGER.error(f"Failed to insert orders in batch: {failed_ids}")
 
+    created_orders = [result for result in results if "orderId" in result and result["orderId"] not in failed_ids]
+    await apply_position_changes([(created_order["stoks"], created_order["quantity"], None, OrderStatus.PENDING)
+                                  for created_order in created_orders])
+    versions = {new_order["orderId"]: new_order["version"] for new_order in new_orders}
+    for created_order in created_orders:
+        order_cache.put(created_order, versions[created_order["orderId"]])
+    await broadcast_order_updates_batch(created_orders)
+    for created_order in created_orders:
+        await executor.submit(created_order["orderId"])
+    return ORJSONResponse([{"error": [{"msg": "Failed to save order"}]} if result.get("orderId") in failed_ids
+                           else result for result in results])
 
-@app.delete("/orders/{order_id}", status_code=204, dependencies=[Depends(short_delay)])
+
+@app.get("/orders/{order_id}", status_code=200, dependencies=[Depends(short_delay("get_order"))])
+async def get_order(order_id: str, if_none_match: Optional[str] = Header(None)) -> Response:
+    """
+    Response has `ETag` of order version, with `If-None-Match` of current version 304 is returned.
+    Cached orders are answered (and compared with `If-None-Match`) without reading storage.
+    """
+    cached = order_cache.get(order_id)
+    if cached:
+        order, version = cached
+    else:
+        stored_order = await orders_repository.get(order_id)
+        if not stored_order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        order, version = serialize_order(stored_order), stored_order.get("version", 0)
+        order_cache.put(order, version)
+    etag = order_etag(order_id, version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(order, headers={"ETag": etag})
+
+
+@app.delete("/orders/{order_id}", status_code=204, dependencies=[Depends(short_delay("cancel_order"))])
 async def cancel_order(order_id: str) -> None:
-    order = await orders_collection.find_one({"orderId": order_id})
-    if not order:
+    try:
+        order = await transition(orders_repository, order_id, OrderStatus.CANCELED)
+    except OrderNotFound:
+        order_cache.invalidate(order_id)
         raise HTTPException(status_code=404, detail="Order not found")
-    if order["orderStatus"] != OrderStatus.PENDING:
+    except InvalidTransition as e:
+        order_cache.put(serialize_order(e.order), e.order.get("version", 0))
         raise HTTPException(status_code=400,
-                            detail=f"Only pending orders can be canceled. Current status: {order['orderStatus']}")
-    await orders_collection.update_one({"orderId": order_id}, {"$set": {"orderStatus": OrderStatus.CANCELED}})
-    await broadcast_order_update(order_id, OrderStatus.CANCELED)
+                            detail=f"Only pending orders can be canceled. Current status: {e.current_status}")
+    await apply_position_changes([(order["stoks"], order["quantity"], OrderStatus.PENDING, OrderStatus.CANCELED)])
+    order_cache.put(serialize_order(order), order["version"])
+    await broadcast_order_update(order)
 
 
 async def process_order(order_id: str) -> None:
-    await asyncio.sleep(random.uniform(0.5, 2))  # Simulate processing time
-    order = await orders_collection.find_one({"orderId": order_id})
-    if order and order["orderStatus"] == OrderStatus.PENDING:
-        await orders_collection.update_one({"orderId": order_id}, {"$set": {"orderStatus": OrderStatus.EXECUTED}})
-        await broadcast_order_update(order_id, OrderStatus.EXECUTED)
+    await latency_profiles.execution.sleep()  # Simulate processing time
+    try:
+        order = await transition(orders_repository, order_id, OrderStatus.EXECUTED)
+    except (OrderNotFound, InvalidTransition) as e:
+        LOGGER.info(f"Order {order_id} was not executed: {e}")
+        return
+    await apply_position_changes([(order["stoks"], order["quantity"], OrderStatus.PENDING, OrderStatus.EXECUTED)])
+    if "createdAt" in order:
+        execution_latency.observe((datetime.now(timezone.utc) - as_utc(order["createdAt"])).total_seconds())
+    order_cache.put(serialize_order(order), order["version"])
+    await broadcast_order_update(order)
+
+
+executor = OrderExecutor(process_order, workers=EXECUTOR_WORKERS, queue_size=EXECUTOR_QUEUE_SIZE)
+
+
+@app.get("/positions", status_code=200, dependencies=[Depends(short_delay("get_positions"))])
+async def get_positions() -> ORJSONResponse:
+    """
+    Number and quantity of orders in every status per stoks.
+    Served from view updated on every order change, orders are never scanned.
+    """
+    return ORJSONResponse([serialize_position(position) for position in await position_store.get_all()])
+
+
+@app.get("/positions/{stoks}", status_code=200, dependencies=[Depends(short_delay("get_position"))])
+async def get_position(stoks: str) -> ORJSONResponse:
+    position = await position_store.get(stoks)
+    if not position:
+        raise HTTPException(status_code=404, detail="Position not found")
+    return ORJSONResponse(serialize_position(position))
+
+
+@app.get("/stats/executor", status_code=200)
+async def get_executor_stats() -> dict:
+    """Order execution queue depth and counters"""
+    return executor.stats()
+
+
+@app.get("/stats/cache", status_code=200)
+async def get_cache_stats() -> dict:
+    """Order cache size and hit/miss counters"""
+    return order_cache.stats()
+
+
+@app.get("/stats/writes", status_code=200)
+async def get_write_stats() -> dict:
+    """Number of storage writes coalesced and groups they were written in, of orders and of positions view"""
+    return {**orders_repository.write_stats(), "positions": position_store.write_stats()}
+
+
+@app.get("/ready", status_code=200)
+async def get_ready(request: Request) -> ORJSONResponse:
+    """Readiness probe: 503 while server is starting or stopping and when storage does not answer"""
+    if not getattr(request.app.state, "ready", False) or not await orders_repository.ping():
+        return ORJSONResponse({"status": "not ready"}, status_code=503)
+    return ORJSONResponse({"status": "ready"})
+
+
+@app.get("/metrics", status_code=200, response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Metrics of this server process in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket) -> None:
-    await websocket.accept()
-    websocket_clients.add(websocket)
+    """Client can ask for compact binary frames with `msgpack` subprotocol, json text frames are sent by default"""
+    requested_subprotocols = websocket.scope.get("subprotocols", [])
+    codec = negotiate_codec(requested_subprotocols)
+    await websocket.accept(subprotocol=codec.name if codec.name in requested_subprotocols else None)
+    broadcaster.register(websocket, codec)
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        websocket_clients.remove(websocket)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            handle_websocket_message(websocket, message.get("text") or message.get("bytes"))
+    finally:
+        broadcaster.discard(websocket)
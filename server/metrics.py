@@ -0,0 +1,156 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# seconds, from fast in-memory operations to slow simulated delays
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets.
+    Observation is a bisect and few additions, cheap enough to time every request.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], list] = {}  # label values -> [counts per bucket + inf, sum]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *label_values: str) -> "Timer":
+        """Context manager observing duration of its block"""
+        return Timer(self, label_values)
+
+    def render(self) -> List[str]:
+        lines = []
+        for label_values, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, label_values: Tuple[str, ...]):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Gauge:
+    """Value read from callback at scrape time, nothing is done between scrapes"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {self.read()}"]
+
+
+class Counter:
+    """Number of events since process start"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+
+class MetricsRegistry:
+    """Metrics of server process rendered in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name: str, description: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def gauge(self, name: str, description: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, description, read))
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(name, description))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing HTTP requests by method, route name (name of route function) and status code.
+    Route is known only after routing, so requests that matched no route are labeled `unmatched`.
+    """
+
+    def __init__(self, app, histogram: Histogram, skip_paths: Iterable[str] = ()):
+        self.app = app
+        self.histogram = histogram
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code: Optional[int] = None
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            self.histogram.observe(time.perf_counter() - start, scope["method"],
+                                   route.name if route else "unmatched", str(status_code or 500))
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError, WriteError
+
+from group_commit import GroupCommitter
+from positions import POSITION_STATUSES, PositionChange, PositionStore, empty_position, position_deltas
+from storage import ORDER_FIELDS, OrderRepository
+
+LOGGER = logging.getLogger(__name__)
+
+# only fields that are part of order, `_id` is never fetched
+ORDER_PROJECTION = {"_id": 0, **{field: 1 for field in ORDER_FIELDS}}
+CURSOR_BATCH_SIZE = 500
+# compound indexes for filtered queries: equality fields first, createdAt range last
+ORDER_INDEXES = [
+    [("orderStatus", 1), ("stoks", 1), ("createdAt", 1)],
+    [("stoks", 1), ("createdAt", 1)],
+    [("createdAt", 1)],
+    # filtered pages sorted by orderId: equality fields, then sort field, then createdAt range (ESR),
+    # so page is read in orderId order from index without in-memory sort or reading not matching orders
+    [("orderStatus", 1), ("stoks", 1), ("orderId", 1), ("createdAt", 1)],
+    [("orderStatus", 1), ("orderId", 1), ("createdAt", 1)],
+    [("stoks", 1), ("orderId", 1), ("createdAt", 1)],
+]
+
+
+class MongoOrderRepository(OrderRepository):
+    """
+    Orders in `orders` collection of mongo, accessed with motor.
+    Client does not connect when created, indexes are built and connections opened by `start`.
+    With `write_window` single inserts and status changes of concurrent requests are written together
+    with one unordered `bulk_write` instead of a round trip to mongo per order.
+    """
+
+    def __init__(self, mongo_uri: str, pool_size: int = 100, warmup_connections: int = 10,
+                 write_window: float = 0, write_group_size: int = 500):
+        self.warmup_connections = min(warmup_connections, pool_size)
+        # warmed up connections are kept open by pool, so idle process doesn't pay for handshakes again
+        self.client = AsyncIOMotorClient(mongo_uri, maxPoolSize=pool_size, minPoolSize=self.warmup_connections)
+        self.collection = self.client.get_default_database("trading").orders
+        self.group_commit = GroupCommitter(self._write_group, write_window, write_group_size) if write_window > 0 else None
+
+    async def start(self) -> None:
+        await self.collection.create_index([("orderId", 1)], unique=True)
+        for index in ORDER_INDEXES:
+            await self.collection.create_index(index)
+        # concurrent commands open connections, so first requests don't wait for them
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(self.warmup_connections)))
+        LOGGER.info(f"orders indexes are ready, {self.warmup_connections} connections to mongo opened")
+
+    async def close(self) -> None:
+        if self.group_commit:
+            await self.group_commit.close()
+        self.client.close()
+
+    async def ping(self, timeout: float = 2) -> bool:
+        try:
+            await asyncio.wait_for(self.client.admin.command("ping"), timeout)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            LOGGER.warning(f"mongo is not available: {e!r}")
+            return False
+        return True
+
+    def write_stats(self) -> dict:
+        return {"enabled": True, **self.group_commit.stats()} if self.group_commit else {"enabled": False}
+
+    async def insert(self, order: dict) -> None:
+        if self.group_commit:
+            await self.group_commit.submit(("insert", order.copy()))
+            return
+        await self.collection.insert_one(order.copy())  # insert_one adds `_id` to document
+
+    async def insert_many(self, orders: List[dict]) -> List[int]:
+        try:
+            await self.collection.insert_many([order.copy() for order in orders], ordered=False)
+        except BulkWriteError as e:
+            return [write_error["index"] for write_error in e.details["writeErrors"]]
+        return []
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"orderId": order_id}, ORDER_PROJECTION)
+
+    async def iter_orders(self, after: Optional[str] = None, limit: Optional[int] = None, status: Optional[str] = None,
+                          stoks: Optional[str] = None, created_from: Optional[datetime] = None,
+                          created_to: Optional[datetime] = None) -> AsyncIterator[dict]:
+        query = {}
+        if after is not None:
+            query["orderId"] = {"$gt": after}
+        if status is not None:
+            query["orderStatus"] = status
+        if stoks is not None:
+            query["stoks"] = stoks
+        if created_from is not None or created_to is not None:
+            query["createdAt"] = {}
+            if created_from is not None:
+                query["createdAt"]["$gte"] = created_from
+            if created_to is not None:
+                query["createdAt"]["$lt"] = created_to
+        cursor = self.collection.find(query, ORDER_PROJECTION, batch_size=CURSOR_BATCH_SIZE)
+        if limit is not None or after is not None:
+            cursor = cursor.sort("orderId", 1)  # without filters served by unique orderId index
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        async for order in cursor:
+            yield order
+
+    async def iter_order_ids(self, status: str, created_before: Optional[datetime] = None) -> AsyncIterator[str]:
+        query = {"orderStatus": status}
+        if created_before is not None:
+            query["$or"] = [{"createdAt": {"$lt": created_before}}, {"createdAt": {"$exists": False}}]
+        async for order in self.collection.find(query, {"_id": 0, "orderId": 1}):
+            yield order["orderId"]
+
+    async def compare_and_set_status(self, order_id: str, from_statuses: List[str], to_status: str,
+                                     expected_version: Optional[int] = None) -> Optional[dict]:
+        condition = {"orderId": order_id, "orderStatus": {"$in": from_statuses}}
+        if expected_version is not None:
+            condition["version"] = expected_version
+        if self.group_commit:
+            return await self.group_commit.submit(("set_status", (condition, to_status)))
+        return await self.collection.find_one_and_update(condition,
+                                                         {"$set": {"orderStatus": to_status}, "$inc": {"version": 1}},
+                                                         projection=ORDER_PROJECTION,
+                                                         return_document=ReturnDocument.AFTER)
+
+    async def _write_group(self, operations: List[Tuple[str, Any]]) -> List[Any]:
+        """
+        Write group of inserts and status changes with one unordered `bulk_write`.
+        Result of bulk write has only total counts, so every status change sets unique `writeToken`,
+        orders are read back with one query and change succeeded if order has its token.
+        Token of order can't be overwritten by other change meanwhile: statuses set by changes are final.
+        Token is left in document: change of later group has to see it was lost, `$unset` would be a write more.
+        """
+        requests, tokens = [], {}
+        for index, (kind, arguments) in enumerate(operations):
+            if kind == "insert":
+                requests.append(InsertOne(arguments))
+            else:
+                condition, to_status = arguments
+                tokens[index] = uuid4().hex
+                requests.append(UpdateOne(condition, {"$set": {"orderStatus": to_status, "writeToken": tokens[index]},
+                                                      "$inc": {"version": 1}}))
+        results: List[Any] = [None] * len(operations)
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                error_class = DuplicateKeyError if write_error["code"] == 11000 else WriteError
+                results[write_error["index"]] = error_class(write_error["errmsg"], write_error["code"], write_error)
+        if tokens:
+            order_ids = [operations[index][1][0]["orderId"] for index in tokens]
+            orders = {order["orderId"]: order async for order in
+                      self.collection.find({"orderId": {"$in": order_ids}}, {**ORDER_PROJECTION, "writeToken": 1})}
+            for index, token in tokens.items():
+                order = orders.get(operations[index][1][0]["orderId"])
+                if results[index] is None and order and order.get("writeToken") == token:
+                    results[index] = {field: value for field, value in order.items() if field != "writeToken"}
+        return results
+
+
+class MongoPositionStore(PositionStore):
+    """
+    Positions in `positions` collection changed with atomic `$inc`, so all server processes share them.
+    With `write_window` changes of concurrent requests are summed per stoks and written with one `bulk_write`,
+    so burst of orders of few popular stoks is a few increments instead of write per order.
+    """
+
+    def __init__(self, collection, write_window: float = 0, write_group_size: int = 500):
+        self.collection = collection
+        self.group_commit = GroupCommitter(self._write_group, write_window, write_group_size) if write_window > 0 else None
+
+    async def initialize(self, repository: OrderRepository) -> None:
+        await self.collection.create_index([("stoks", 1)], unique=True)
+        if await self.collection.find_one({}, {"_id": 1}):
+            return
+        positions = await self._compute(repository)
+        if positions:
+            try:
+                await self.collection.insert_many(list(positions.values()), ordered=False)
+            except BulkWriteError:  # other server process built positions at the same time
+                pass
+
+    async def rebuild(self, repository: OrderRepository) -> List[str]:
+        positions = await self._compute(repository)
+        if positions:
+            await self.collection.bulk_write([ReplaceOne({"stoks": stoks}, position, upsert=True)
+                                              for stoks, position in positions.items()], ordered=False)
+        await self.collection.delete_many({"stoks": {"$nin": list(positions)}})
+        return list(positions)
+
+    @staticmethod
+    async def _compute(repository: OrderRepository) -> Dict[str, dict]:
+        """Positions of all stoks computed from orders by aggregation in mongo"""
+        positions = {}
+        async for group in repository.collection.aggregate([{"$group": {
+            "_id": {"stoks": "$stoks", "status": "$orderStatus"},
+            "orders": {"$sum": 1}, "quantity": {"$sum": "$quantity"},
+        }}]):
+            stoks, status = group["_id"]["stoks"], group["_id"]["status"]
+            if status in POSITION_STATUSES:
+                position = positions.setdefault(stoks, empty_position(stoks))
+                position[f"{status}Orders"] = group["orders"]
+                position[f"{status}Quantity"] = group["quantity"]
+        return positions
+
+    async def apply(self, changes: List[PositionChange]) -> None:
+        if not changes:
+            return
+        if self.group_commit:
+            await self.group_commit.submit(changes)
+            return
+        await self._increment(changes)
+
+    async def _write_group(self, groups: List[List[PositionChange]]) -> List[None]:
+        await self._increment([change for changes in groups for change in changes])
+        return [None] * len(groups)
+
+    async def _increment(self, changes: List[PositionChange]) -> None:
+        updates = [UpdateOne({"stoks": stoks}, {"$inc": delta}, upsert=True)
+                   for stoks, delta in position_deltas(changes).items()]
+        if updates:
+            await self.collection.bulk_write(updates, ordered=False)
+
+    async def close(self) -> None:
+        if self.group_commit:
+            await self.group_commit.close()
+
+    def write_stats(self) -> dict:
+        return {"enabled": True, **self.group_commit.stats()} if self.group_commit else {"enabled": False}
+
+    async def get(self, stoks: str) -> Optional[dict]:
+        return await self.collection.find_one({"stoks": stoks}, {"_id": 0})
+
+    async def get_all(self) -> List[dict]:
+        return await self.collection.find({}, {"_id": 0}).sort("stoks", 1).to_list(None)
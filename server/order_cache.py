@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class OrderCache:
+    """
+    Bounded in-memory cache of orders (API representation) and their versions by orderId.
+    Least recently used orders are evicted when cache is full, entries older than `ttl` seconds are not served.
+    Version is kept so ETag of cached order is known without db.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._orders = OrderedDict()  # orderId -> (expires at, order, version)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, order_id: str) -> Optional[Tuple[dict, int]]:
+        """Cached order and its version"""
+        entry = self._orders.get(order_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._orders[order_id]
+            self.misses += 1
+            return None
+        self._orders.move_to_end(order_id)
+        self.hits += 1
+        return dict(entry[1]), entry[2]
+
+    def put(self, order: dict, version: int) -> None:
+        """
+        Cache order unless newer version (or not expired same version) is cached already:
+        read started before order was changed must not replace order put by the change.
+        """
+        if self.max_size <= 0:
+            return
+        order_id = order["orderId"]
+        now = time.monotonic()
+        entry = self._orders.get(order_id)
+        if entry is not None and (entry[2] > version or entry[2] == version and entry[0] >= now):
+            return
+        self._orders[order_id] = (now + self.ttl, dict(order), version)
+        self._orders.move_to_end(order_id)
+        while len(self._orders) > self.max_size:
+            self._orders.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, order_id: str) -> None:
+        self._orders.pop(order_id, None)
+
+    def clear(self) -> None:
+        self._orders.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._orders),
+            "maxSize": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
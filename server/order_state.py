@@ -0,0 +1,52 @@
+from typing import Optional
+
+from storage import OrderRepository
+
+
+class OrderStatus:
+    PENDING = "pending"
+    EXECUTED = "executed"
+    CANCELED = "canceled"
+
+
+# target status -> statuses order can be moved from
+TRANSITIONS = {
+    OrderStatus.EXECUTED: [OrderStatus.PENDING],
+    OrderStatus.CANCELED: [OrderStatus.PENDING],
+}
+
+
+class OrderNotFound(Exception):
+    pass
+
+
+class InvalidTransition(Exception):
+    def __init__(self, order: dict, to_status: str):
+        self.order = order
+        self.current_status = order["orderStatus"]
+        self.to_status = to_status
+        super().__init__(f"Order {order['orderId']} can't be moved from {self.current_status} to {to_status}")
+
+
+async def transition(repository: OrderRepository, order_id: str, to_status: str,
+                     expected_version: Optional[int] = None) -> dict:
+    """
+    Atomically move order to `to_status` with one conditional update (compare-and-set).
+    Every successful transition increments `version` of order, so concurrent transitions can't both win.
+    :param repository: orders storage
+    :param order_id: id of order
+    :param to_status: target status, one of TRANSITIONS keys
+    :param expected_version: apply transition only if order was not changed since this version
+    :return: order after transition
+    :raises OrderNotFound: there is no such order
+    :raises InvalidTransition: order status (or version) does not allow transition
+    """
+    order = await repository.compare_and_set_status(order_id, TRANSITIONS[to_status], to_status, expected_version)
+    if order:
+        return order
+
+    # transition failed, one more read only to explain why
+    current_order = await repository.get(order_id)
+    if not current_order:
+        raise OrderNotFound(f"Order {order_id} not found")
+    raise InvalidTransition(current_order, to_status)
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from order_state import OrderStatus
+from storage import OrderRepository
+
+LOGGER = logging.getLogger(__name__)
+
+POSITION_STATUSES = (OrderStatus.PENDING, OrderStatus.EXECUTED, OrderStatus.CANCELED)
+# (stoks, quantity, status order moved from - None for new order, status order moved to)
+PositionChange = Tuple[str, float, Optional[str], str]
+
+
+def empty_position(stoks: str) -> dict:
+    position = {"stoks": stoks}
+    for status in POSITION_STATUSES:
+        position[f"{status}Orders"] = 0
+        position[f"{status}Quantity"] = 0.0
+    return position
+
+
+def position_deltas(changes: Iterable[PositionChange]) -> Dict[str, Dict[str, float]]:
+    """Sum changes of orders into one increment of counters per stoks"""
+    deltas: Dict[str, Dict[str, float]] = {}
+    for stoks, quantity, from_status, to_status in changes:
+        delta = deltas.setdefault(stoks, {})
+        if from_status is not None:
+            delta[f"{from_status}Orders"] = delta.get(f"{from_status}Orders", 0) - 1
+            delta[f"{from_status}Quantity"] = delta.get(f"{from_status}Quantity", 0) - quantity
+        delta[f"{to_status}Orders"] = delta.get(f"{to_status}Orders", 0) + 1
+        delta[f"{to_status}Quantity"] = delta.get(f"{to_status}Quantity", 0) + quantity
+    return deltas
+
+
+def serialize_position(position: dict) -> dict:
+    """API representation, quantities are rounded to hide float error accumulated by increments"""
+    serialized = empty_position(position["stoks"])
+    for field in serialized:
+        if field.endswith("Quantity"):
+            serialized[field] = round(position.get(field, 0.0), 8) + 0.0  # + 0.0 turns -0.0 into 0.0
+        elif field.endswith("Orders"):
+            serialized[field] = position.get(field, 0)
+    return serialized
+
+
+class PositionStore:
+    """
+    Materialized view of orders: number and quantity of orders in every status per stoks.
+    Updated incrementally on every order change, so reading it never scans orders.
+    """
+
+    async def initialize(self, repository: OrderRepository) -> None:
+        """Build view from orders when it is empty (first start, orders created before view existed)"""
+        raise NotImplementedError
+
+    async def rebuild(self, repository: OrderRepository) -> List[str]:
+        """
+        Replace view with positions computed from orders. View is changed only by order changes made through API,
+        orders written to storage directly (migrations, test data) make it wrong until it is rebuilt.
+        Order changes made while orders are read can be lost, so run it when orders are not being changed.
+        :return: stoks of rebuilt positions
+        """
+        raise NotImplementedError
+
+    async def apply(self, changes: List[PositionChange]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Finish pending writes, called on app shutdown before storage is closed"""
+
+    def write_stats(self) -> dict:
+        """Counters of writes coalesced into groups, see GroupCommitter"""
+        return {"enabled": False}
+
+    async def get(self, stoks: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def get_all(self) -> List[dict]:
+        """Positions of all stoks sorted by stoks"""
+        raise NotImplementedError
+
+
+class MemoryPositionStore(PositionStore):
+    """Positions in dict of this process, changed without awaiting, so every change is atomic within event loop"""
+
+    def __init__(self):
+        self.positions: Dict[str, dict] = {}
+
+    async def initialize(self, repository: OrderRepository) -> None:
+        if not self.positions:
+            await self.rebuild(repository)
+
+    async def rebuild(self, repository: OrderRepository) -> List[str]:
+        changes = [(order["stoks"], order["quantity"], None, order["orderStatus"])
+                   async for order in repository.iter_orders()]
+        self.positions = {}
+        await self.apply(changes)
+        return list(self.positions)
+
+    async def apply(self, changes: List[PositionChange]) -> None:
+        for stoks, delta in position_deltas(changes).items():
+            position = self.positions.setdefault(stoks, empty_position(stoks))
+            for field, increment in delta.items():
+                position[field] += increment
+
+    async def get(self, stoks: str) -> Optional[dict]:
+        position = self.positions.get(stoks)
+        return dict(position) if position else None
+
+    async def get_all(self) -> List[dict]:
+        return [dict(self.positions[stoks]) for stoks in sorted(self.positions)]
+
+
+class PositionPublisher:
+    """
+    Pushes current positions of changed stoks.
+    One task reads position of every changed stoks after its latest change, so burst of changes
+    of the same stoks gives one push and pushes of the same stoks never come out of order.
+    """
+
+    def __init__(self, store: PositionStore, publish: Callable[[dict], None]):
+        self.store = store
+        self.publish = publish
+        self.changed = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_changed(self, stoks: Iterable[str]) -> None:
+        self.changed.update(stoks)
+        if self.changed and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._push(), name="positions-publisher")
+
+    async def _push(self) -> None:
+        while self.changed:
+            stoks = self.changed.pop()
+            try:
+                position = await self.store.get(stoks)
+            except Exception as e:
+                LOGGER.error(f"Failed to read position of {stoks}: {e}")
+                continue
+            if position:
+                self.publish(position)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def create_position_store(kind: str, repository: OrderRepository, write_window: float = 0,
+                          write_group_size: int = 500) -> PositionStore:
+    """
+    :param kind: `mongo` or `memory`, the same as storage of orders
+    :param repository: orders storage, `mongo` positions are kept in `positions` collection of its db
+    :param write_window: seconds changes of positions are collected to be written together to mongo, 0 - not collected
+    :param write_group_size: max number of changes written together
+    """
+    if kind == "memory":
+        return MemoryPositionStore()
+    if kind == "mongo":
+        from mongo_storage import MongoPositionStore  # motor is needed only for mongo storage
+        return MongoPositionStore(repository.collection.database.positions, write_window=write_window,
+                                  write_group_size=write_group_size)
+    raise ValueError(f"Unknown storage: {kind}")
@@ -0,0 +1,41 @@
+from collections import deque
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+
+class ReplayBuffer:
+    """
+    Numbers order updates with increasing sequence numbers and keeps the latest of them,
+    so reconnected WebSocket client can get only updates it missed.
+    Sequence numbers belong to one server process, `stream_id` tells processes (and restarts) apart.
+    """
+
+    def __init__(self, size: int = 10000):
+        self.stream_id = uuid4().hex
+        self.seq = 0
+        self.updates = deque(maxlen=size)  # (seq, message, topics)
+
+    def record(self, message: dict, topics: Iterable[str]) -> dict:
+        """Give update next sequence number and remember it, returns update with `seq`"""
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.updates.append((self.seq, message, list(topics)))
+        return message
+
+    def reset(self) -> None:
+        """Start new stream: updates recorded so far are incomplete, clients resuming them have to resync"""
+        self.stream_id = uuid4().hex
+        self.updates.clear()
+
+    def since(self, last_seq: int) -> Optional[List[Tuple[dict, List[str]]]]:
+        """
+        Updates after `last_seq`, oldest first.
+        :return: list of (update, topics) or None if some of missed updates are not in buffer anymore
+        """
+        if last_seq > self.seq:  # sequence from other stream
+            return None
+        oldest_seq = self.updates[0][0] if self.updates else self.seq + 1
+        if last_seq < oldest_seq - 1:
+            return None
+        return [(message, topics) for _, message, topics in islice(self.updates, last_seq + 1 - oldest_seq, None)]
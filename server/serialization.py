@@ -0,0 +1,52 @@
+from typing import Any, Dict, Iterable, Union
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, without it WebSocket clients get only json
+    msgpack = None
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj)
+
+
+class JsonCodec:
+    """Default WebSocket format, text frames"""
+    name = "json"
+    binary = False
+
+    def encode(self, obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """Compact WebSocket format, binary frames"""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):  # text frames are always json
+            return orjson.loads(data)
+        return msgpack.unpackb(data)
+
+
+JSON = JsonCodec()
+CODECS: Dict[str, Union[JsonCodec, MsgpackCodec]] = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def negotiate_codec(subprotocols: Iterable[str]) -> Union[JsonCodec, MsgpackCodec]:
+    """First supported WebSocket subprotocol requested by client, json when there is none"""
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol]
+    return JSON
@@ -0,0 +1,294 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# fields of order returned by repositories
+ORDER_FIELDS = ("orderId", "stoks", "quantity", "orderStatus", "version", "createdAt")
+# number of sorted orderIds memory storage reads at once while looking for orders of page
+SCAN_CHUNK_SIZE = 500
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Naive datetimes (mongo returns them) are UTC"""
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class OrderRepository:
+    """
+    Interface of order storage.
+    Orders are dicts with ORDER_FIELDS, storage specific fields (like mongo `_id`) are never returned.
+    """
+
+    async def start(self) -> None:
+        """Prepare storage before first request (connections, indexes), called in app lifespan"""
+
+    async def close(self) -> None:
+        """Release connections, called on app shutdown"""
+
+    async def ping(self, timeout: float = 2) -> bool:
+        """Storage answers in `timeout` seconds"""
+        return True
+
+    def write_stats(self) -> dict:
+        """Counters of writes coalesced into groups, see GroupCommitter"""
+        return {"enabled": False}
+
+    async def insert(self, order: dict) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, orders: List[dict]) -> List[int]:
+        """Insert all orders that can be inserted, returns indexes of orders failed to insert"""
+        raise NotImplementedError
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def iter_orders(self, after: Optional[str] = None, limit: Optional[int] = None, status: Optional[str] = None,
+                    stoks: Optional[str] = None, created_from: Optional[datetime] = None,
+                    created_to: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """
+        Iterate orders without loading all of them in memory.
+        With `after` or `limit` orders are sorted by orderId and start after given orderId.
+        :param status: only orders with this status
+        :param stoks: only orders with this stoks
+        :param created_from: only orders created at this moment or later
+        :param created_to: only orders created before this moment
+        """
+        raise NotImplementedError
+
+    def iter_order_ids(self, status: str, created_before: Optional[datetime] = None) -> AsyncIterator[str]:
+        """orderIds of orders with status, only created before `created_before` (or without createdAt) if given"""
+        raise NotImplementedError
+
+    async def compare_and_set_status(self, order_id: str, from_statuses: List[str], to_status: str,
+                                     expected_version: Optional[int] = None) -> Optional[dict]:
+        """
+        Atomically set status of order if its current status is one of `from_statuses`
+        (and version is `expected_version` if given), increments version.
+        :return: order after update or None if order does not match conditions
+        """
+        raise NotImplementedError
+
+
+class DuplicateOrderError(Exception):
+    pass
+
+
+def _created_in(order: dict, created_from: Optional[datetime], created_to: Optional[datetime]) -> bool:
+    created_at = order.get("createdAt")
+    if created_from is not None and (created_at is None or created_at < created_from):
+        return False
+    return created_to is None or (created_at is not None and created_at < created_to)
+
+
+class MemoryOrderRepository(OrderRepository):
+    """
+    In-process storage on dicts, for single box deployments, load tests and running without mongo.
+    Like mongo indexes, secondary indexes by orderStatus, stoks and both of them keep orderIds sorted,
+    so page of filtered orders is found by bisect and read in orderId order without sorting whole filtered set.
+    Orders sorted by createdAt are kept for time range scans without pagination.
+    Every method changes data without awaiting, so operations are atomic within event loop.
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, dict] = {}
+        self.sorted_ids: List[str] = []
+        self.by_status: Dict[str, List[str]] = {}  # sorted orderIds
+        self.by_stoks: Dict[str, List[str]] = {}
+        self.by_status_stoks: Dict[Tuple[str, str], List[str]] = {}
+        self.by_created: List[Tuple[datetime, str]] = []
+
+    @staticmethod
+    def _copy(order: dict) -> dict:
+        return {field: order[field] for field in ORDER_FIELDS if field in order}
+
+    def _secondary_indexes(self, order: dict) -> List[Tuple[dict, Any]]:
+        return [(self.by_status, order["orderStatus"]), (self.by_stoks, order["stoks"]),
+                (self.by_status_stoks, (order["orderStatus"], order["stoks"]))]
+
+    def _index(self, order: dict) -> None:
+        for index, key in self._secondary_indexes(order):
+            insort(index.setdefault(key, []), order["orderId"])
+
+    def _unindex(self, order: dict) -> None:
+        for index, key in self._secondary_indexes(order):
+            order_ids = index.get(key, [])
+            position = bisect_left(order_ids, order["orderId"])
+            if position < len(order_ids) and order_ids[position] == order["orderId"]:
+                del order_ids[position]
+
+    def _insert(self, order: dict) -> None:
+        if order["orderId"] in self.orders:
+            raise DuplicateOrderError(f"Order {order['orderId']} already exists")
+        order = self._copy(order)
+        if "createdAt" in order:
+            order["createdAt"] = as_utc(order["createdAt"])
+            insort(self.by_created, (order["createdAt"], order["orderId"]))
+        self.orders[order["orderId"]] = order
+        insort(self.sorted_ids, order["orderId"])
+        self._index(order)
+
+    async def insert(self, order: dict) -> None:
+        self._insert(order)
+
+    async def insert_many(self, orders: List[dict]) -> List[int]:
+        failed = []
+        for index, order in enumerate(orders):
+            try:
+                self._insert(order)
+            except DuplicateOrderError:
+                failed.append(index)
+        return failed
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        order = self.orders.get(order_id)
+        return self._copy(order) if order else None
+
+    async def iter_orders(self, after: Optional[str] = None, limit: Optional[int] = None, status: Optional[str] = None,
+                          stoks: Optional[str] = None, created_from: Optional[datetime] = None,
+                          created_to: Optional[datetime] = None) -> AsyncIterator[dict]:
+        created_from = as_utc(created_from) if created_from is not None else None
+        created_to = as_utc(created_to) if created_to is not None else None
+        if status is None and stoks is None and after is None and limit is None and \
+                (created_from is not None or created_to is not None):
+            # only time range without pagination: range of orders sorted by createdAt
+            start = bisect_left(self.by_created, (created_from,)) if created_from is not None else 0
+            end = bisect_left(self.by_created, (created_to,)) if created_to is not None else None
+            for _, order_id in self.by_created[start:end]:
+                order = self.orders.get(order_id)
+                if order:
+                    yield self._copy(order)
+            return
+
+        if status is not None and stoks is not None:
+            order_ids = self.by_status_stoks.get((status, stoks), [])
+        elif status is not None:
+            order_ids = self.by_status.get(status, [])
+        elif stoks is not None:
+            order_ids = self.by_stoks.get(stoks, [])
+        else:
+            order_ids = self.sorted_ids
+        # sorted orderIds are read in chunks from bisect after the last read one, so page costs O(log n + page)
+        # and orders changed while caller awaits between yields are neither skipped nor repeated
+        last_id, found = after, 0
+        while True:
+            start = bisect_right(order_ids, last_id) if last_id is not None else 0
+            chunk = order_ids[start:start + SCAN_CHUNK_SIZE]
+            if not chunk:
+                return
+            for order_id in chunk:
+                last_id = order_id
+                order = self.orders.get(order_id)
+                if not order or not _created_in(order, created_from, created_to):
+                    continue
+                yield self._copy(order)
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    async def iter_order_ids(self, status: str, created_before: Optional[datetime] = None) -> AsyncIterator[str]:
+        for order_id in list(self.by_status.get(status, ())):
+            created_at = self.orders[order_id].get("createdAt")
+            if created_before is None or created_at is None or as_utc(created_at) < created_before:
+                yield order_id
+
+    async def compare_and_set_status(self, order_id: str, from_statuses: List[str], to_status: str,
+                                     expected_version: Optional[int] = None) -> Optional[dict]:
+        order = self.orders.get(order_id)
+        if not order or order["orderStatus"] not in from_statuses:
+            return None
+        if expected_version is not None and order.get("version") != expected_version:
+            return None
+        self._unindex(order)
+        order["orderStatus"] = to_status
+        order["version"] = order.get("version", 0) + 1
+        self._index(order)
+        return self._copy(order)
+
+
+class TimedOrderRepository(OrderRepository):
+    """
+    Repository observing duration of every operation of wrapped repository in `histogram` (labeled by operation).
+    Iteration is timed only while waiting for storage, not while consumer handles orders.
+    Other attributes (like mongo `collection`) are taken from wrapped repository.
+    """
+
+    def __init__(self, repository: OrderRepository, histogram):
+        self.repository = repository
+        self.histogram = histogram
+
+    def __getattr__(self, name: str):
+        return getattr(self.repository, name)
+
+    async def start(self) -> None:
+        await self.repository.start()
+
+    async def close(self) -> None:
+        await self.repository.close()
+
+    async def ping(self, timeout: float = 2) -> bool:
+        return await self.repository.ping(timeout)
+
+    def write_stats(self) -> dict:
+        return self.repository.write_stats()
+
+    async def insert(self, order: dict) -> None:
+        with self.histogram.time("insert"):
+            await self.repository.insert(order)
+
+    async def insert_many(self, orders: List[dict]) -> List[int]:
+        with self.histogram.time("insert_many"):
+            return await self.repository.insert_many(orders)
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        with self.histogram.time("get"):
+            return await self.repository.get(order_id)
+
+    async def _timed_iteration(self, operation: str, iterator: AsyncIterator) -> AsyncIterator:
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.histogram.observe(elapsed, operation)
+
+    def iter_orders(self, after: Optional[str] = None, limit: Optional[int] = None, status: Optional[str] = None,
+                    stoks: Optional[str] = None, created_from: Optional[datetime] = None,
+                    created_to: Optional[datetime] = None) -> AsyncIterator[dict]:
+        return self._timed_iteration("iter_orders", self.repository.iter_orders(
+            after=after, limit=limit, status=status, stoks=stoks, created_from=created_from, created_to=created_to))
+
+    def iter_order_ids(self, status: str, created_before: Optional[datetime] = None) -> AsyncIterator[str]:
+        return self._timed_iteration("iter_order_ids", self.repository.iter_order_ids(status, created_before))
+
+    async def compare_and_set_status(self, order_id: str, from_statuses: List[str], to_status: str,
+                                     expected_version: Optional[int] = None) -> Optional[dict]:
+        with self.histogram.time("compare_and_set_status"):
+            return await self.repository.compare_and_set_status(order_id, from_statuses, to_status, expected_version)
+
+
+def create_repository(kind: str, mongo_uri: str, pool_size: int = 100, warmup_connections: int = 10,
+                      write_window: float = 0, write_group_size: int = 500) -> OrderRepository:
+    """
+    :param kind: `mongo` or `memory`
+    :param mongo_uri: connection string of mongo, used by `mongo` repository
+    :param pool_size: max number of connections to mongo
+    :param warmup_connections: number of connections to mongo opened on start and kept open
+    :param write_window: seconds single writes are collected to be written together to mongo, 0 - not collected
+    :param write_group_size: max number of writes written together
+    """
+    if kind == "memory":
+        return MemoryOrderRepository()
+    if kind == "mongo":
+        from mongo_storage import MongoOrderRepository  # motor is needed only for mongo storage
+        return MongoOrderRepository(mongo_uri, pool_size=pool_size, warmup_connections=warmup_connections,
+                                    write_window=write_window, write_group_size=write_group_size)
+    raise ValueError(f"Unknown storage: {kind}")
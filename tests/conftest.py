@@ -1,21 +1,38 @@
 import httpx
+import logging
 import pytest
 from requests.adapters import HTTPAdapter
 from requests_toolbelt import sessions
 from random import randint
 from pymongo import MongoClient
-from helpers.db_helpers import populate_test_data_in_db, clean_test_data
+from helpers.db_helpers import populate_test_data_in_db, clean_test_data, generate_orders, bulk_insert_orders, \
+    clean_namespace, STOKS_WEIGHTS
 from urllib.parse import urljoin
+from pathlib import Path
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import sys
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# server modules for unit tests (tests/tests/test_broadcaster.py), mounted next to tests in docker-compose
+SERVER_SOURCE = Path(__file__).parent.parent / "server"
+if SERVER_SOURCE.is_dir():
+    sys.path.append(str(SERVER_SOURCE))
 
 
 @pytest.fixture(scope="session")
-def mongo_connection_string():
-    url = "mongodb://mongo:27017/trading" #  not very dynamic but for this project - ok
+def mongo_connection_string(request):
+    url = request.config.getoption("--mongo-url")
     return url
 
 
 @pytest.fixture(scope="session")
 def orders_collection(request, mongo_connection_string):
+    if not mongo_connection_string:
+        pytest.skip("test data can't be put in db without mongo (server runs with STORAGE=memory)")
     client = MongoClient(mongo_connection_string)
     db = client.trading
     yield db.orders
@@ -25,6 +42,22 @@ def orders_collection(request, mongo_connection_string):
 def pytest_addoption(parser):
     parser.addoption("--url", action="store", default="http://localhost:8000",
                      help="url to api server")
+    parser.addoption("--mongo-url", action="store", default="mongodb://mongo:27017/trading",
+                     help="connection string of server db, empty when server runs without mongo")
+    parser.addoption("--scale-orders", action="store", type=int, default=100000,
+                     help="scale tests: number of orders generated in db")
+    parser.addoption("--bench-duration", action="store", type=float, default=10,
+                     help="benchmark: seconds of sending requests")
+    parser.addoption("--bench-concurrency", action="store", type=int, default=20,
+                     help="benchmark: number of concurrent requests")
+    parser.addoption("--bench-mix", action="store", default="create=4,get=4,list=1,cancel=1",
+                     help="benchmark: weights of requests; ex create=4,get=4,list=1,cancel=1")
+    parser.addoption("--bench-ws-listeners", action="store", type=int, default=5,
+                     help="benchmark: number of WebSocket clients measuring delivery lag")
+    parser.addoption("--bench-results", action="store", default=str(Path(__file__).parent / "reports" / "benchmark_results.json"),
+                     help="benchmark: where json results are written")
+    parser.addoption("--bench-baseline", action="store", default=str(Path(__file__).parent / "benchmark_baseline.json"),
+                     help="benchmark: json thresholds results are checked against")
 
 
 @pytest.fixture(scope="session")
@@ -71,9 +104,18 @@ def order_status():
     return OrderStatus
 
 
+@pytest.fixture(scope="session")
+def test_data_namespace(worker_id):
+    """
+    Part of ids of test data unique for xdist worker (`master` without xdist),
+    so tests running in parallel never share or clean up orders of each other
+    """
+    return worker_id
+
+
 @pytest.fixture(scope="function")
-def pending_order_data_fixture(orders_collection):
-    data = {"orderId": "test_pending", "stoks": "EURUSD", "quantity": 100.4, "orderStatus": OrderStatus.PENDING}
+def pending_order_data_fixture(orders_collection, test_data_namespace):
+    data = {"orderId": f"test_pending_{test_data_namespace}", "stoks": "EURUSD", "quantity": 100.4, "orderStatus": OrderStatus.PENDING}
     clean_test_data(orders_collection, data['orderId'])
     populate_test_data_in_db(orders_collection, data)
     yield data
@@ -81,8 +123,8 @@ def pending_order_data_fixture(orders_collection):
 
 
 @pytest.fixture(scope="function")
-def executed_order_data_fixture(orders_collection):
-    data = {"orderId": "test_executed", "stoks": "EURUSD", "quantity": 200.2, "orderStatus": OrderStatus.EXECUTED}
+def executed_order_data_fixture(orders_collection, test_data_namespace):
+    data = {"orderId": f"test_executed_{test_data_namespace}", "stoks": "EURUSD", "quantity": 200.2, "orderStatus": OrderStatus.EXECUTED}
     clean_test_data(orders_collection, data['orderId'])
     populate_test_data_in_db(orders_collection, data)
     yield data
@@ -90,8 +132,8 @@ def executed_order_data_fixture(orders_collection):
 
 
 @pytest.fixture(scope="function")
-def canceled_order_data_fixture(orders_collection):
-    data = {"orderId": "test_canceled", "stoks": "EURUSD", "quantity": 300.3, "orderStatus": OrderStatus.CANCELED}
+def canceled_order_data_fixture(orders_collection, test_data_namespace):
+    data = {"orderId": f"test_canceled_{test_data_namespace}", "stoks": "EURUSD", "quantity": 300.3, "orderStatus": OrderStatus.CANCELED}
     clean_test_data(orders_collection, data['orderId'])
     populate_test_data_in_db(orders_collection, data)
     yield data
@@ -99,8 +141,8 @@ def canceled_order_data_fixture(orders_collection):
 
 
 @pytest.fixture(scope="function")
-def get_order_fixture(orders_collection):
-    data = {"orderId": "test_get_order", "stoks": "EURUSD", "quantity": 400, "orderStatus": OrderStatus.PENDING}
+def get_order_fixture(orders_collection, test_data_namespace):
+    data = {"orderId": f"test_get_order_{test_data_namespace}", "stoks": "EURUSD", "quantity": 400, "orderStatus": OrderStatus.PENDING}
     clean_test_data(orders_collection, data['orderId'])
     populate_test_data_in_db(orders_collection, data)
     yield data
@@ -108,9 +150,51 @@ def get_order_fixture(orders_collection):
 
 
 @pytest.fixture(scope="function")
-def get_all_orders_fixture(orders_collection):
-    data = {"orderId": "test_get_all_orders", "stoks": "EURUSD", "quantity": 400, "orderStatus": OrderStatus.PENDING}
+def get_all_orders_fixture(orders_collection, test_data_namespace):
+    data = {"orderId": f"test_get_all_orders_{test_data_namespace}", "stoks": "EURUSD", "quantity": 400, "orderStatus": OrderStatus.PENDING}
     clean_test_data(orders_collection, data['orderId'])
     populate_test_data_in_db(orders_collection, data)
     yield data
     clean_test_data(orders_collection, data['orderId'])
+
+
+class ScaleOrders:
+    """Orders generated by `scale_orders` fixture and what tests should get from server for them"""
+
+    def __init__(self, namespace: str, stoks_weights: dict, created_to: datetime):
+        self.namespace = namespace
+        self.stoks_weights = stoks_weights
+        self.created_to = created_to
+        # window inside of creation period with known number of orders
+        self.window_from = created_to - timedelta(days=7)
+        self.window_to = created_to - timedelta(days=1)
+        self.count = 0
+        self.by_stoks_status = Counter()  # (stoks, status) -> number of orders
+        self.by_stoks_in_window = Counter()  # stoks -> number of orders created in window
+
+    def count_orders(self, orders):
+        for order in orders:
+            self.count += 1
+            self.by_stoks_status[(order["stoks"], order["orderStatus"])] += 1
+            if self.window_from <= order["createdAt"] < self.window_to:
+                self.by_stoks_in_window[order["stoks"]] += 1
+            yield order
+
+
+@pytest.fixture(scope="session")
+def scale_orders(request, orders_collection, test_data_namespace):
+    """
+    Big collection (--scale-orders) for tests of list, filter and pagination at realistic sizes.
+    Symbols get namespace suffix, so filters by stoks return only generated orders.
+    """
+    namespace = f"scale_{test_data_namespace}_{uuid4().hex[:8]}"
+    stoks_weights = {f"{stoks}_{namespace}": weight for stoks, weight in STOKS_WEIGHTS.items()}
+    now = datetime.now(timezone.utc)
+    data = ScaleOrders(namespace, stoks_weights, created_to=now.replace(microsecond=now.microsecond // 1000 * 1000))
+    orders = generate_orders(namespace, request.config.getoption("--scale-orders"), seed=42,
+                             stoks_weights=stoks_weights, created_to=data.created_to)
+    start = time.perf_counter()
+    bulk_insert_orders(orders_collection, data.count_orders(orders))
+    LOGGER.info(f"{data.count} orders generated in {time.perf_counter() - start:.1f} sec")
+    yield data
+    clean_namespace(orders_collection, namespace)
@@ -31,22 +31,37 @@ def create_order(client: Session, stoks: str = "EURUSD", quantity: float = 100.5
     return response
 
 
-def get_order(client: Session, order_id: str) -> Response:
+def create_orders_batch(client: Session, orders: list) -> Response:
+    """
+    :param client: requests client with set up base url
+    :param orders: list of orders data; ex [{"stoks": "EURUSD", "quantity": 100.5}]
+    :return: requests Response obj
+    """
+    response = client.post("/orders/batch", json=orders)
+    return response
+
+
+def get_order(client: Session, order_id: str, headers: Optional[dict] = None) -> Response:
     """
     :param client: requests client with set up base url
     :param order_id: id of requested order
+    :param headers: custom headers; ex {"If-None-Match": etag}
     :return: requests Response obj
     """
-    response = client.get(f"/orders/{order_id}")
+    response = client.get(f"/orders/{order_id}", headers=headers)
     return response
 
 
-def get_orders(client: Session) -> Response:
+def get_orders(client: Session, params: Optional[dict] = None, headers: Optional[dict] = None,
+               stream: bool = False) -> Response:
     """
     :param client: requests client with set up base url
+    :param params: query params; ex {"limit": 10, "after": "some-order-id"}
+    :param headers: custom headers; ex {"Accept": "application/x-ndjson"}
+    :param stream: do not download response body immediately, used for ndjson streaming
     :return: requests Response obj
     """
-    response = client.get("/orders")
+    response = client.get("/orders", params=params, headers=headers, stream=stream)
     return response
 
 
@@ -58,3 +73,58 @@ def cancel_order(client: Session, order_id: str) -> Response:
     """
     response = client.delete(f"/orders/{order_id}")
     return response
+
+
+def get_executor_stats(client: Session) -> Response:
+    """
+    :param client: requests client with set up base url
+    :return: requests Response obj
+    """
+    response = client.get("/stats/executor")
+    return response
+
+
+def get_cache_stats(client: Session) -> Response:
+    """
+    :param client: requests client with set up base url
+    :return: requests Response obj
+    """
+    response = client.get("/stats/cache")
+    return response
+
+
+def get_write_stats(client: Session) -> Response:
+    """
+    :param client: requests client with set up base url
+    :return: requests Response obj
+    """
+    response = client.get("/stats/writes")
+    return response
+
+
+def get_metrics(client: Session) -> Response:
+    """
+    :param client: requests client with set up base url
+    :return: requests Response obj
+    """
+    response = client.get("/metrics")
+    return response
+
+
+def get_position(client: Session, stoks: str) -> Response:
+    """
+    :param client: requests client with set up base url
+    :param stoks: str; ex EURUSD
+    :return: requests Response obj
+    """
+    response = client.get(f"/positions/{stoks}")
+    return response
+
+
+def get_ready(client: Session) -> Response:
+    """
+    :param client: requests client with set up base url
+    :return: requests Response obj
+    """
+    response = client.get("/ready")
+    return response
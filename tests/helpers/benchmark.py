@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from statistics import mean
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+LOGGER = logging.getLogger(__name__)
+
+OPERATIONS = ("create", "get", "list", "cancel")
+# cancel of order executed in the meantime is answered with 400, it is expected under load
+EXPECTED_STATUSES = {"create": {201}, "get": {200}, "list": {200}, "cancel": {204, 400}}
+LIST_PAGE_SIZE = 100
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Request mix from string of weights; ex "create=4,get=4,list=1,cancel=1"
+    """
+    weights = {}
+    for item in mix.split(","):
+        operation, _, weight = item.partition("=")
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}' in request mix, expected: {', '.join(OPERATIONS)}")
+        weights[operation] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "mean": mean(values), "p50": percentile(values, 50),
+            "p95": percentile(values, 95), "p99": percentile(values, 99), "max": max(values)}
+
+
+class WebSocketListener:
+    """Connected client remembering when it first received every status of every order"""
+
+    def __init__(self, ws_url: str):
+        self.ws_url = ws_url
+        self.received: Dict[tuple, float] = {}  # (orderId, orderStatus) -> receive time
+        self.messages = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.websocket = await websockets.connect(self.ws_url, max_queue=None)
+        self.task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        async for frame in self.websocket:
+            received_at = time.perf_counter()
+            updates = json.loads(frame)
+            for update in updates if isinstance(updates, list) else [updates]:
+                if "orderId" in update:
+                    self.messages += 1
+                    self.received.setdefault((update["orderId"], update["orderStatus"]), received_at)
+
+    async def stop(self) -> None:
+        await self.websocket.close()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+class Benchmark:
+    """
+    Load generator: `concurrency` workers send requests picked from request mix for `duration` seconds,
+    `ws_listeners` WebSocket clients measure how fast order updates get to them.
+    WebSocket lag is measured from sending create request, so it includes create request duration:
+    `pending` - till PENDING update delivered, `executed` - till EXECUTED update delivered.
+    """
+
+    def __init__(self, base_url: str, ws_url: str, concurrency: int = 20, duration: float = 10,
+                 mix: Optional[Dict[str, float]] = None, ws_listeners: int = 5, seed: Optional[int] = None,
+                 drain_timeout: float = 10):
+        self.base_url = base_url
+        self.ws_url = ws_url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.mix = mix or parse_mix("create=4,get=4,list=1,cancel=1")
+        self.ws_listeners = ws_listeners
+        self.random = random.Random(seed)
+        self.drain_timeout = drain_timeout
+        self.latencies: Dict[str, List[float]] = {operation: [] for operation in OPERATIONS}
+        self.errors: Dict[str, int] = {operation: 0 for operation in OPERATIONS}
+        self.created_at: Dict[str, float] = {}  # orderId -> time create request was sent
+        self.pending_ids: List[str] = []
+
+    def _pick_operation(self) -> str:
+        operations = list(self.mix)
+        operation = self.random.choices(operations, weights=[self.mix[name] for name in operations])[0]
+        if operation in ("get", "cancel") and not self.pending_ids:
+            return "create"  # nothing to get or cancel yet
+        return operation
+
+    async def _request(self, client: httpx.AsyncClient, operation: str) -> None:
+        start = time.perf_counter()
+        try:
+            if operation == "create":
+                response = await client.post("/orders", json={"stoks": "EURUSD", "quantity": 1})
+                if response.status_code == 201:
+                    order_id = response.json()["orderId"]
+                    self.created_at[order_id] = start
+                    self.pending_ids.append(order_id)
+            elif operation == "get":
+                response = await client.get(f"/orders/{self.random.choice(self.pending_ids)}")
+            elif operation == "list":
+                response = await client.get("/orders", params={"limit": LIST_PAGE_SIZE})
+            else:
+                order_id = self.pending_ids.pop(self.random.randrange(len(self.pending_ids)))
+                response = await client.delete(f"/orders/{order_id}")
+            status_code = response.status_code
+        except httpx.HTTPError as e:
+            LOGGER.warning(f"{operation} request failed: {e}")
+            status_code = None
+        self.latencies[operation].append(time.perf_counter() - start)
+        if status_code not in EXPECTED_STATUSES[operation]:
+            self.errors[operation] += 1
+
+    async def _worker(self, client: httpx.AsyncClient, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            await self._request(client, self._pick_operation())
+
+    async def _drain(self, listener: WebSocketListener) -> None:
+        """Wait till listener gets final updates of all created orders, so they don't get to other tests"""
+        deadline = time.perf_counter() + self.drain_timeout
+        while time.perf_counter() < deadline:
+            if all((order_id, "executed") in listener.received or (order_id, "canceled") in listener.received
+                   for order_id in self.created_at):
+                return
+            await asyncio.sleep(0.1)
+        LOGGER.warning(f"not all order updates received in {self.drain_timeout} sec after benchmark")
+
+    def _lags(self, listeners: List[WebSocketListener], status: str) -> List[float]:
+        lags = []
+        for listener in listeners:
+            for order_id, sent_at in self.created_at.items():
+                received_at = listener.received.get((order_id, status))
+                if received_at is not None:
+                    lags.append(received_at - sent_at)
+        return lags
+
+    async def run(self) -> dict:
+        listeners = [WebSocketListener(self.ws_url) for _ in range(self.ws_listeners)]
+        for listener in listeners:
+            await listener.start()
+
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=30) as client:
+            start = time.perf_counter()
+            deadline = start + self.duration
+            await asyncio.gather(*(self._worker(client, deadline) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        if listeners:
+            await self._drain(listeners[0])
+        for listener in listeners:
+            await listener.stop()
+
+        requests_count = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "config": {"concurrency": self.concurrency, "duration": self.duration, "mix": self.mix,
+                       "wsListeners": self.ws_listeners},
+            "elapsed": elapsed,
+            "requests": requests_count,
+            "requestsPerSecond": requests_count / elapsed,
+            "errorRate": sum(self.errors.values()) / requests_count if requests_count else 0,
+            "operations": {operation: {**summarize(latencies), "errors": self.errors[operation],
+                                       "errorRate": self.errors[operation] / len(latencies) if latencies else 0}
+                           for operation, latencies in self.latencies.items() if latencies},
+            "websocket": {
+                "messages": sum(listener.messages for listener in listeners),
+                "pendingLag": summarize(self._lags(listeners, "pending")),
+                "executedLag": summarize(self._lags(listeners, "executed")),
+            },
+        }
+
+
+def check_thresholds(results: dict, thresholds: dict) -> List[str]:
+    """
+    Compare results with baseline thresholds, which mirror structure of results and have
+    {"max": ...} or {"min": ...} in place of values; ex {"operations": {"create": {"p95": {"max": 1.5}}}}.
+    Keys starting with `_` are comments. Thresholds of what was not measured are skipped:
+    operations not in request mix and summaries with zero count (ex WebSocket lag without listeners).
+    :return: list of violated thresholds, empty when results are good enough
+    """
+    mix = results["config"]["mix"]
+    thresholds = {**thresholds, "operations": {operation: threshold for operation, threshold
+                                               in thresholds.get("operations", {}).items() if operation in mix}}
+    return _check_thresholds(results, thresholds, "")
+
+
+def _check_thresholds(results: dict, thresholds: dict, path: str) -> List[str]:
+    violations = []
+    for key, threshold in thresholds.items():
+        if key.startswith("_"):
+            continue
+        key_path = f"{path}.{key}" if path else key
+        if key not in results:
+            violations.append(f"{key_path}: missing in results")
+        elif isinstance(results[key], dict) and results[key].get("count") == 0:
+            continue
+        elif "max" in threshold or "min" in threshold:
+            value = results[key]
+            if "max" in threshold and value > threshold["max"]:
+                violations.append(f"{key_path}: {value:.4f} > max {threshold['max']}")
+            if "min" in threshold and value < threshold["min"]:
+                violations.append(f"{key_path}: {value:.4f} < min {threshold['min']}")
+        else:
+            violations.extend(_check_thresholds(results[key], threshold, key_path))
+    return violations
@@ -1,7 +1,18 @@
 import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
 from pymongo.collection import Collection
 LOGGER = logging.getLogger(__name__)
 
+# realistic shape of orders collection: most orders are executed, few are still pending
+STATUS_WEIGHTS = {"executed": 0.75, "canceled": 0.15, "pending": 0.10}
+# few popular symbols get most of orders
+STOKS_WEIGHTS = {"EURUSD": 0.30, "USDJPY": 0.18, "GBPUSD": 0.14, "AUDUSD": 0.09, "USDCHF": 0.07, "USDCAD": 0.06,
+                 "NZDUSD": 0.05, "EURGBP": 0.04, "EURJPY": 0.04, "GBPJPY": 0.03}
+
 
 def populate_test_data_in_db(mongo_collection: Collection, data: dict):
     LOGGER.info(f"adding order to orders collection: {data}")
@@ -11,4 +22,78 @@ def populate_test_data_in_db(mongo_collection: Collection, data: dict):
 def clean_test_data(mongo_collection: Collection, order_id: str):
     """Removes test data from given collection (orders) by orderId."""
     LOGGER.info(f"removing order with id '{order_id}' from orders collection")
-    mongo_collection.delete_one({"orderId": order_id})
\ No newline at end of file
+    mongo_collection.delete_one({"orderId": order_id})
+
+
+def generate_orders(namespace: str, count: int, seed: Optional[int] = None,
+                    status_weights: Dict[str, float] = STATUS_WEIGHTS, stoks_weights: Dict[str, float] = STOKS_WEIGHTS,
+                    created_to: Optional[datetime] = None, days: float = 30) -> Iterator[dict]:
+    """
+    Lazily generate orders with realistic distribution of statuses, symbols, quantities and creation times.
+    orderId starts with `namespace`, so orders can be removed with `clean_namespace`,
+    the rest of it is random like uuid, so order of orderIds has nothing to do with creation time.
+    :param namespace: tag of generated data; ex "scale_gw0"
+    :param seed: the same seed gives the same orders
+    :param created_to: orders are created during `days` before this moment (now by default)
+    """
+    generator = random.Random(seed)
+    created_to = created_to or datetime.now(timezone.utc)
+    created_to = created_to.replace(microsecond=created_to.microsecond // 1000 * 1000)  # mongo keeps milliseconds
+    period_ms = int(days * 24 * 3600 * 1000)
+    statuses, status_cum_weights = list(status_weights), list(_cumulative(status_weights.values()))
+    stoks, stoks_cum_weights = list(stoks_weights), list(_cumulative(stoks_weights.values()))
+    for number in range(count):
+        status = generator.choices(statuses, cum_weights=status_cum_weights)[0]
+        yield {
+            "orderId": f"{namespace}:{generator.getrandbits(64):016x}{number:08x}",
+            "stoks": generator.choices(stoks, cum_weights=stoks_cum_weights)[0],
+            "quantity": round(generator.lognormvariate(4, 1.2), 2) or 0.01,
+            "orderStatus": status,
+            "version": 1 if status == "pending" else 2,
+            "createdAt": created_to - timedelta(milliseconds=generator.randrange(1, period_ms)),
+        }
+
+
+def _cumulative(weights: Iterable[float]) -> Iterator[float]:
+    total = 0
+    for weight in weights:
+        total += weight
+        yield total
+
+
+def _chunks(orders: Iterable[dict], chunk_size: int) -> Iterator[List[dict]]:
+    orders = iter(orders)
+    while chunk := list(islice(orders, chunk_size)):
+        yield chunk
+
+
+def bulk_insert_orders(mongo_collection: Collection, orders: Iterable[dict], chunk_size: int = 10000,
+                       parallelism: int = 4) -> int:
+    """
+    Insert orders with unordered `insert_many` in chunks, `parallelism` chunks are written concurrently
+    (pymongo client is thread safe and has pool of connections). Orders are generated while chunks are written,
+    so 10^6 orders never are in memory at once.
+    :return: number of inserted orders
+    """
+    inserted = 0
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        in_flight = []
+        for chunk in _chunks(orders, chunk_size):
+            in_flight.append(pool.submit(mongo_collection.insert_many, chunk, ordered=False))
+            if len(in_flight) >= parallelism * 2:  # don't generate much more than can be written
+                inserted += len(in_flight.pop(0).result().inserted_ids)
+        for future in in_flight:
+            inserted += len(future.result().inserted_ids)
+    LOGGER.info(f"inserted {inserted} orders in orders collection")
+    return inserted
+
+
+def clean_namespace(mongo_collection: Collection, namespace: str) -> int:
+    """
+    Removes all orders generated with given namespace.
+    Range of orderIds with namespace prefix is served by unique orderId index, no collection scan.
+    :return: number of removed orders
+    """
+    deleted = mongo_collection.delete_many({"orderId": {"$gt": f"{namespace}:", "$lt": f"{namespace};"}}).deleted_count
+    LOGGER.info(f"removed {deleted} orders of namespace '{namespace}' from orders collection")
+    return deleted
@@ -0,0 +1,50 @@
+import asyncio
+import json
+from typing import Any, Callable, Iterable, List, Union
+
+# tests run in parallel, so WebSocket clients without subscription get updates of orders of other tests too;
+# helpers below pick messages test is waiting for and skip everything else
+
+
+def frame_updates(frame: Any) -> List[dict]:
+    """Order updates of frame, batch of updates is sent as list in one frame"""
+    updates = frame if isinstance(frame, list) else [frame]
+    return [update for update in updates if isinstance(update, dict) and "orderId" in update]
+
+
+async def wait_for_order_messages(websocket, order_ids: Union[str, Iterable[str]], count: int = 1,
+                                  timeout: float = 10, decode: Callable[[Any], Any] = json.loads) -> List[dict]:
+    """
+    Receive `count` updates of given orders, updates of other orders and replies to client messages are skipped
+    :param websocket: connected websockets client
+    :param order_ids: orderId or several orderIds
+    :param decode: decoder of frames; ex msgpack.unpackb for msgpack clients
+    :return: updates in the order they were received
+    """
+    order_ids = {order_ids} if isinstance(order_ids, str) else set(order_ids)
+    messages = []
+    async with asyncio.timeout(timeout):
+        while len(messages) < count:
+            frame = decode(await websocket.recv())
+            messages.extend(update for update in frame_updates(frame) if update["orderId"] in order_ids)
+    return messages[:count]
+
+
+async def wait_for_order_frame(websocket, order_ids: Union[str, Iterable[str]], timeout: float = 10,
+                               decode: Callable[[Any], Any] = json.loads) -> Union[dict, list]:
+    """Receive first frame with update of any of given orders, returned as it is (update or list of updates)"""
+    order_ids = {order_ids} if isinstance(order_ids, str) else set(order_ids)
+    async with asyncio.timeout(timeout):
+        while True:
+            frame = decode(await websocket.recv())
+            if any(update["orderId"] in order_ids for update in frame_updates(frame)):
+                return frame
+
+
+async def wait_for_reply(websocket, timeout: float = 10, decode: Callable[[Any], Any] = json.loads) -> dict:
+    """Receive reply to client message (subscription confirmation, error, ...), order updates are skipped"""
+    async with asyncio.timeout(timeout):
+        while True:
+            frame = decode(await websocket.recv())
+            if not isinstance(frame, list) and "orderId" not in frame:
+                return frame
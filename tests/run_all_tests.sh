@@ -1,7 +1,11 @@
 #!/bin/sh
 
-# Run API tests in parallel first
-pytest -m api -n 5 --html=reports/api_test_report.html --self-contained-html --url http://server:8000
+# Run API and WebSocket tests in parallel, test data and WebSocket messages of every test are isolated
+pytest -m "not benchmark and not scale" -n auto --html=reports/test_report.html --self-contained-html --url http://server:8000
 
-# Then run WebSocket tests sequentially
-pytest -m websockets --html=reports/websockets_test_report.html --self-contained-html --url http://server:8000
+# Then run tests on big generated collection
+pytest -m scale --html=reports/scale_test_report.html --self-contained-html --url http://server:8000
+
+# Then run load benchmark alone against server without simulated delays,
+# it fails when results are past thresholds of benchmark_baseline.json
+pytest -m benchmark --html=reports/benchmark_test_report.html --self-contained-html --url http://benchmark_server:8000 --bench-results reports/benchmark_results.json
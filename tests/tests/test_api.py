@@ -1,5 +1,10 @@
+import json
+import time
 import pytest
-from helpers.api_helpers import create_order, get_order, get_orders, cancel_order
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from helpers.api_helpers import create_order, get_order, get_orders, cancel_order, get_executor_stats, \
+    create_orders_batch, get_cache_stats, get_metrics, get_position, get_ready, get_write_stats
 
 
 @pytest.mark.api
@@ -149,3 +154,357 @@ def test_get_all_orders(api_client, get_all_orders_fixture):
         assert 'orderId' in order, "Missing orderId"
         assert 'orderStatus' in order, "Missing orderStatus"
         assert isinstance(order['quantity'], (int, float)), f"Invalid quantity in order {order['orderId']}"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_orders_paginated(api_client):
+    """
+    1. create 3 orders so there is always more than one page
+    2. walk pages of size 2 using X-Next-Cursor header
+    3. assert pages are sorted, have no duplicates and contain created orders
+    """
+    created_ids = {create_order(api_client, stoks="EURUSD", quantity=1).json()["orderId"] for _ in range(3)}
+
+    first_page_response = get_orders(api_client, params={"limit": 2})
+    assert first_page_response.status_code == 200, "response code should be 200 when retrieving page of orders"
+    first_page = first_page_response.json()
+    assert len(first_page) == 2, "page size should be equal to limit"
+    assert "X-Next-Cursor" in first_page_response.headers, "full page should have X-Next-Cursor header"
+
+    retrieved_ids = [order["orderId"] for order in first_page]
+    cursor = first_page_response.headers["X-Next-Cursor"]
+    while cursor:
+        page_response = get_orders(api_client, params={"limit": 2, "after": cursor})
+        assert page_response.status_code == 200, "response code should be 200 when retrieving page of orders"
+        retrieved_ids.extend(order["orderId"] for order in page_response.json())
+        cursor = page_response.headers.get("X-Next-Cursor")
+
+    assert retrieved_ids == sorted(retrieved_ids), "pages should be sorted by orderId"
+    assert len(retrieved_ids) == len(set(retrieved_ids)), "pages should not overlap"
+    assert created_ids.issubset(retrieved_ids), "not all created orders were found on pages"
+
+
+@pytest.mark.api
+@pytest.mark.negative_scenario
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_get_orders_invalid_limit(api_client, limit):
+    """
+    1. get orders with limit out of allowed range
+    2. assert 422 returned
+    """
+    retrieved_orders_response = get_orders(api_client, params={"limit": limit})
+    assert retrieved_orders_response.status_code == 422, "response code should be 422 for invalid limit"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_orders_ndjson_stream(api_client, get_all_orders_fixture):
+    """
+    1. request orders as ndjson stream
+    2. assert every line is order with valid data and fixture order is there
+    """
+    response = get_orders(api_client, headers={"Accept": "application/x-ndjson"}, stream=True)
+    assert response.status_code == 200, "response code should be 200 when streaming orders"
+    assert response.headers["content-type"].startswith("application/x-ndjson"), "unexpected content type"
+    orders = [json.loads(line) for line in response.iter_lines() if line]
+    assert len(orders) != 0, "stream of orders is empty!"
+    for order in orders:
+        assert set(order) - {"createdAt"} == {"orderId", "stoks", "quantity", "orderStatus"}, \
+            f"unexpected fields in order {order}"
+    assert get_all_orders_fixture in orders, "fixture order not found in stream"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_executor_stats(api_client):
+    """
+    1. get order executor stats
+    2. assert all counters are there and have valid values
+    """
+    stats_response = get_executor_stats(api_client)
+    assert stats_response.status_code == 200, "response code should be 200 when retrieving executor stats"
+    stats = stats_response.json()
+    assert set(stats) == {"workers", "queueSize", "queueDepth", "inProgress", "processed", "failed"}, \
+        "unexpected executor stats keys"
+    assert stats["workers"] > 0, "executor should have workers"
+    assert 0 <= stats["queueDepth"] <= stats["queueSize"], "queue depth out of queue size bounds"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_create_orders_batch(api_client, order_status):
+    """
+    1. create batch with valid and invalid orders
+    2. assert valid orders were created and invalid have errors, in the same order
+    3. get created orders
+    """
+    batch = [{"stoks": "EURUSD", "quantity": 10}, {"stoks": "EURUSD", "quantity": 0}, {"quantity": 1},
+             {"stoks": "AUDEUR", "quantity": 20.5}]
+    batch_response = create_orders_batch(api_client, batch)
+    assert batch_response.status_code == 200, "response code should be 200 for batch of orders"
+    results = batch_response.json()
+    assert len(results) == len(batch), "there should be result for every order in batch"
+
+    for result, order_data in zip((results[0], results[3]), (batch[0], batch[3])):
+        assert result["orderStatus"] == order_status.PENDING, "orderStatus should be pending right after creating order"
+        assert result["stoks"] == order_data["stoks"], "stoks should be the same as in batch"
+        retrieved_order_response = get_order(api_client, result["orderId"])
+        assert retrieved_order_response.status_code == 200, "order from batch was not saved"
+
+    assert results[1]["error"][0]["loc"] == ["quantity"], "error for order with zero quantity expected"
+    assert results[2]["error"][0]["loc"] == ["stoks"], "error for order without stoks expected"
+
+
+@pytest.mark.api
+@pytest.mark.negative_scenario
+@pytest.mark.parametrize("batch", [[], {"stoks": "EURUSD", "quantity": 1}])
+def test_create_orders_invalid_batch(api_client, batch):
+    """
+    1. create batch which is empty or not a list
+    2. assert 422 returned
+    """
+    batch_response = create_orders_batch(api_client, batch)
+    assert batch_response.status_code == 422, "response code should be 422 for invalid batch"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_order_served_from_cache(api_client):
+    """
+    1. create order and get it several times
+    2. assert cache hits counter grew
+    """
+    order_id = create_order(api_client, stoks="EURUSD", quantity=1).json()["orderId"]
+    hits_before = get_cache_stats(api_client).json()["hits"]
+    for _ in range(3):
+        retrieved_order_response = get_order(api_client, order_id)
+        assert retrieved_order_response.status_code == 200, "response code should be 200 for retrieving valid order"
+    cache_stats = get_cache_stats(api_client).json()
+    assert cache_stats["hits"] >= hits_before + 3, "recently created order should be served from cache"
+    assert 0 < cache_stats["size"] <= cache_stats["maxSize"], "cache size out of bounds"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_concurrent_writes(api_client, order_status):
+    """
+    1. create orders and cancel them concurrently, so their writes can be coalesced into groups
+    2. assert every order was created and every cancel result matches stored order
+    3. assert coalesced writes are counted when coalescing is enabled
+    """
+    stats_before = get_write_stats(api_client).json()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        create_responses = list(pool.map(lambda _: create_order(api_client, stoks="EURUSD", quantity=1), range(20)))
+        assert all(response.status_code == 201 for response in create_responses), \
+            "response code should be 201 for every concurrently created order"
+        order_ids = [response.json()["orderId"] for response in create_responses]
+        cancel_responses = list(pool.map(lambda order_id: cancel_order(api_client, order_id), order_ids))
+
+    for order_id, cancel_response in zip(order_ids, cancel_responses):
+        # order could be executed before cancel
+        assert cancel_response.status_code in (204, 400), "unexpected response code for cancel"
+        stored_order = get_order(api_client, order_id).json()
+        expected_status = order_status.CANCELED if cancel_response.status_code == 204 else order_status.EXECUTED
+        assert stored_order["orderStatus"] == expected_status, "stored order doesn't match cancel result"
+
+    stats = get_write_stats(api_client).json()
+    if stats["enabled"]:
+        assert stats["operations"] >= stats_before["operations"] + len(order_ids), "coalesced writes not counted"
+        assert 0 < stats["groups"] <= stats["operations"], "writes should be written in groups"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_concurrent_cancels_single_winner(api_client, order_status):
+    """
+    1. create order and cancel it with several concurrent requests (racing with its execution too)
+    2. assert at most one cancel succeeded: one 204 and canceled order, or only 400 when order was executed first
+    3. assert order was changed exactly once: version (part of ETag) is 2
+    """
+    order_id = create_order(api_client, stoks="EURUSD", quantity=1).json()["orderId"]
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        cancel_codes = list(pool.map(lambda _: cancel_order(api_client, order_id).status_code, range(10)))
+    assert set(cancel_codes) <= {204, 400}, "unexpected response code for concurrent cancel"
+
+    order_response = get_order(api_client, order_id)
+    if 204 in cancel_codes:
+        assert cancel_codes.count(204) == 1, "only one of concurrent cancels should succeed"
+        assert order_response.json()["orderStatus"] == order_status.CANCELED, "order should be canceled"
+    else:
+        assert order_response.json()["orderStatus"] == order_status.EXECUTED, "order should be executed before cancels"
+    assert order_response.headers["ETag"] == f'"{order_id}-2"', "order should be changed exactly once"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_order_not_modified(api_client, order_status):
+    """
+    1. create order and cancel it (or it is executed already), so order is not changed anymore
+    2. assert ETag of created order is not current anymore
+    3. get order with current ETag, assert 304 without body
+    """
+    create_response = create_order(api_client, stoks="EURUSD", quantity=1)
+    created_etag = create_response.headers["ETag"]
+    order_id = create_response.json()["orderId"]
+    cancel_response = cancel_order(api_client, order_id)
+    assert cancel_response.status_code in (204, 400), "unexpected response code for cancel"
+
+    changed_response = get_order(api_client, order_id, headers={"If-None-Match": created_etag})
+    assert changed_response.status_code == 200, "response code should be 200 when order changed since ETag"
+    etag = changed_response.headers["ETag"]
+    assert etag != created_etag, "ETag should change with order status"
+    assert changed_response.json()["orderStatus"] in (order_status.CANCELED, order_status.EXECUTED)
+
+    not_modified_response = get_order(api_client, order_id, headers={"If-None-Match": etag})
+    assert not_modified_response.status_code == 304, "response code should be 304 for current ETag"
+    assert not_modified_response.content == b"", "304 response should not have body"
+    assert not_modified_response.headers["ETag"] == etag, "304 response should have current ETag"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_orders_not_modified(api_client):
+    """
+    1. get page of orders, then get it again with its ETag
+    2. assert 304 while no order changed (orders of parallel tests change often, so several attempts)
+    3. create order, assert old ETag gives 200 with new ETag
+    """
+    params = {"limit": 1}
+    for _ in range(20):
+        etag = get_orders(api_client, params=params).headers["ETag"]
+        if get_orders(api_client, params=params, headers={"If-None-Match": etag}).status_code == 304:
+            break
+    else:
+        pytest.fail("response code should be 304 for current ETag of orders")
+
+    create_order(api_client, stoks="EURUSD", quantity=1)
+    for _ in range(50):  # update comes asynchronously with shared backplane
+        changed_response = get_orders(api_client, params=params, headers={"If-None-Match": etag})
+        if changed_response.status_code == 200:
+            break
+        time.sleep(0.1)
+    assert changed_response.status_code == 200, "response code should be 200 when orders changed since ETag"
+    assert changed_response.headers["ETag"] != etag, "ETag should change with orders"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_get_orders_filtered(api_client, order_status):
+    """
+    1. create 2 orders with unique stoks and cancel one of them (it can be executed first under load)
+    2. get orders filtered by stoks, by stoks and status, by stoks and creation time
+    3. assert only matching orders returned
+    """
+    stoks = f"FLT{uuid4().hex[:8].upper()}"
+    first_order = create_order(api_client, stoks=stoks, quantity=1).json()
+    second_order = create_order(api_client, stoks=stoks, quantity=2).json()
+    cancel_response = cancel_order(api_client, second_order["orderId"])
+    assert cancel_response.status_code in (204, 400), "cancel order should return 204, or 400 if it was executed already"
+    # either way status of order is final now
+    second_status = order_status.CANCELED if cancel_response.status_code == 204 else order_status.EXECUTED
+
+    by_stoks = get_orders(api_client, params={"stoks": stoks}).json()
+    assert {order["orderId"] for order in by_stoks} == {first_order["orderId"], second_order["orderId"]}, \
+        "filter by stoks returned unexpected orders"
+
+    by_status = [order["orderId"] for order in get_orders(api_client, params={"stoks": stoks, "status": second_status}).json()]
+    if second_status == order_status.CANCELED:  # first order is never canceled
+        assert by_status == [second_order["orderId"]], "filter by stoks and status returned unexpected orders"
+    else:  # first order can be executed too
+        assert second_order["orderId"] in by_status and set(by_status) <= {first_order["orderId"], second_order["orderId"]}, \
+            "filter by stoks and status returned unexpected orders"
+
+    created_from = get_orders(api_client, params={"stoks": stoks, "createdFrom": second_order["createdAt"]}).json()
+    created_before = get_orders(api_client, params={"stoks": stoks, "createdTo": first_order["createdAt"]}).json()
+    assert second_order["orderId"] in {order["orderId"] for order in created_from}, "createdFrom should be inclusive"
+    assert created_before == [], "createdTo should be exclusive"
+
+
+@pytest.mark.api
+@pytest.mark.negative_scenario
+def test_get_orders_invalid_created_from(api_client):
+    """
+    1. get orders with createdFrom which is not a datetime
+    2. assert 422 returned
+    """
+    retrieved_orders_response = get_orders(api_client, params={"createdFrom": "yesterday"})
+    assert retrieved_orders_response.status_code == 422, "response code should be 422 for invalid createdFrom"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_position_updated_by_order_changes(api_client, order_status):
+    """
+    1. create 2 orders with unique stoks and cancel one of them
+    2. get position of stoks
+    3. assert number and quantity of orders moved from pending to final statuses
+    """
+    stoks = f"POS{uuid4().hex[:8].upper()}"
+    create_order(api_client, stoks=stoks, quantity=1.5)
+    second_order = create_order(api_client, stoks=stoks, quantity=2.5).json()
+    pending_position = get_position(api_client, stoks).json()
+    assert pending_position["pendingOrders"] + pending_position["executedOrders"] == 2, "position should count created orders"
+    assert pending_position["pendingQuantity"] + pending_position["executedQuantity"] == 4, \
+        "position should sum quantity of created orders"
+
+    cancel_response = cancel_order(api_client, second_order["orderId"])
+    assert cancel_response.status_code in (204, 400), "cancel order should return 204, or 400 if it was executed already"
+    if cancel_response.status_code == 204:
+        position = get_position(api_client, stoks).json()
+        assert (position["canceledOrders"], position["canceledQuantity"]) == (1, 2.5), \
+            "canceled order should be moved to canceled in position"
+        assert position["pendingOrders"] + position["executedOrders"] == 1, "canceled order should leave pending"
+
+
+@pytest.mark.api
+@pytest.mark.negative_scenario
+def test_get_position_unknown_stoks(api_client):
+    """
+    1. get position of stoks without orders
+    2. assert 404 returned
+    """
+    position_response = get_position(api_client, f"NONE{uuid4().hex[:8].upper()}")
+    assert position_response.status_code == 404, "response code should be 404 for stoks without orders"
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_ready(api_client):
+    """
+    1. get readiness of started server
+    2. assert it is ready
+    """
+    ready_response = get_ready(api_client)
+    assert ready_response.status_code == 200, "started server should be ready"
+    assert ready_response.json() == {"status": "ready"}, "unexpected readiness response"
+
+
+def metric_value(metrics_text: str, series: str) -> float:
+    """Value of one series (name with labels) from Prometheus text format, 0 when series is not there yet"""
+    for line in metrics_text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+@pytest.mark.api
+@pytest.mark.positive_scenario
+def test_metrics(api_client):
+    """
+    1. get metrics, create order and get metrics again
+    2. assert request, simulated delay and storage counters grew
+    """
+    create_order_count = 'http_request_duration_seconds_count{method="POST",route="create_order",status="201"}'
+    delay_count = 'http_request_simulated_delay_seconds_count{route="create_order"}'
+    insert_count = 'storage_operation_duration_seconds_count{operation="insert"}'
+    metrics_before = get_metrics(api_client).text
+    assert create_order(api_client, stoks="EURUSD", quantity=1).status_code == 201, "create valid order should return 201"
+
+    metrics_response = get_metrics(api_client)
+    assert metrics_response.status_code == 200, "response code should be 200 for metrics"
+    assert metrics_response.headers["content-type"].startswith("text/plain"), "metrics should be in Prometheus text format"
+    for series in (create_order_count, delay_count, insert_count):
+        assert metric_value(metrics_response.text, series) >= metric_value(metrics_before, series) + 1, \
+            f"{series} should grow after creating order"
+    assert "# TYPE websocket_clients gauge" in metrics_response.text, "WebSocket clients count should be in metrics"
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+backplane = pytest.importorskip("backplane", reason="server source is needed for backplane unit tests")
+
+
+class FakeChangeStream:
+    """
+    Change stream giving prepared items: (resume token, change event) or error raised at that point.
+    Without items it waits like stream without changes.
+    """
+
+    def __init__(self, *items):
+        self.items = list(items)
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            await asyncio.Event().wait()
+        item = self.items.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        self.resume_token, event = item
+        return event
+
+
+class FakeCollection:
+    """Orders collection opening prepared change streams one by one, remembers resume tokens they were opened with"""
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.resumed_after = []
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resumed_after.append(resume_after)
+        return self.streams.pop(0)
+
+
+def order_change(order_id: str) -> dict:
+    return {"fullDocument": {"orderId": order_id, "orderStatus": "pending"}}
+
+
+async def watch(collection: FakeCollection, updates_count: int, on_gap=None) -> list:
+    """Run backplane on fake collection until it delivers `updates_count` updates"""
+    updates = []
+    change_stream_backplane = backplane.MongoChangeStreamBackplane(collection, resume_delay=0.01)
+    await change_stream_backplane.start(updates.extend, on_gap=on_gap)
+    try:
+        async with asyncio.timeout(5):
+            while len(updates) < updates_count:
+                await asyncio.sleep(0.01)
+    finally:
+        await change_stream_backplane.stop()
+    return updates
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_change_stream_resumed_after_failure():
+    """
+    1. change stream delivers update and fails
+    2. assert stream is resumed after token of delivered update, next update is delivered, no gap reported
+    """
+    gaps = []
+    collection = FakeCollection(FakeChangeStream(("token1", order_change("1")), AutoReconnect("connection lost")),
+                                FakeChangeStream(("token2", order_change("2"))))
+    updates = await watch(collection, 2, on_gap=lambda: gaps.append(True))
+    assert [update["orderId"] for update in updates] == ["1", "2"], "updates should be delivered in order"
+    assert collection.resumed_after == [None, "token1"], "stream should be resumed after the last delivered update"
+    assert not gaps, "no updates were lost"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_change_stream_restarted_when_history_lost():
+    """
+    1. change stream can't be resumed: resume token is not in oplog anymore (ChangeStreamHistoryLost)
+    2. assert stream is started from now instead of retrying with the same token, gap is reported
+    """
+    gaps = []
+    collection = FakeCollection(FakeChangeStream(("token1", order_change("1")), AutoReconnect("connection lost")),
+                                FakeChangeStream(OperationFailure("history lost", backplane.CHANGE_STREAM_HISTORY_LOST)),
+                                FakeChangeStream(("token3", order_change("3"))))
+    updates = await watch(collection, 2, on_gap=lambda: gaps.append(True))
+    assert [update["orderId"] for update in updates] == ["1", "3"], "updates after restart should be delivered"
+    assert collection.resumed_after == [None, "token1", None], "stream should be restarted without lost token"
+    assert gaps == [True], "lost updates should be reported once"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_position_changes_delivered_from_positions_change_stream():
+    """
+    1. order of EURUSD is created, then its position is incremented
+    2. assert position change is delivered from change stream of positions, after position is written
+    """
+    updates, changed_stoks = [], []
+    orders = FakeCollection(FakeChangeStream(("token1", order_change("1"))))
+    positions = FakeCollection(FakeChangeStream(("token2", {"fullDocument": {"stoks": "EURUSD", "pendingOrders": 1}})))
+    change_stream_backplane = backplane.MongoChangeStreamBackplane(orders, positions, resume_delay=0.01)
+    await change_stream_backplane.start(updates.extend, on_positions=changed_stoks.extend)
+    try:
+        async with asyncio.timeout(5):
+            while not updates or not changed_stoks:
+                await asyncio.sleep(0.01)
+    finally:
+        await change_stream_backplane.stop()
+    assert [update["orderId"] for update in updates] == ["1"], "order update should be delivered"
+    assert changed_stoks == ["EURUSD"], "changed stoks should be delivered from positions change stream"
@@ -0,0 +1,43 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+from helpers.benchmark import Benchmark, check_thresholds, parse_mix
+
+LOGGER = logging.getLogger(__name__)
+
+
+@pytest.mark.asyncio
+@pytest.mark.benchmark
+async def test_benchmark(request, base_url, ws_url):
+    """
+    Load benchmark:
+    1. Send mix of create/get/list/cancel requests with configured concurrency and duration,
+       listen to order updates with configured number of WebSocket clients.
+    2. Write latency percentiles, requests/sec and WebSocket delivery lag to json results file.
+    3. Validate results are within baseline thresholds.
+    """
+    config = request.config
+    benchmark = Benchmark(base_url, ws_url,
+                          concurrency=config.getoption("--bench-concurrency"),
+                          duration=config.getoption("--bench-duration"),
+                          mix=parse_mix(config.getoption("--bench-mix")),
+                          ws_listeners=config.getoption("--bench-ws-listeners"))
+    results = await benchmark.run()
+
+    results_path = Path(config.getoption("--bench-results"))
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    results_path.write_text(json.dumps(results, indent=2))
+    LOGGER.info(f"Benchmark results written to {results_path}")
+    LOGGER.info(f"Requests/sec: {results['requestsPerSecond']:.1f}, error rate: {results['errorRate']:.4f}")
+    for operation, stats in results["operations"].items():
+        LOGGER.info(f"{operation}: p50 {stats['p50']:.4f} p95 {stats['p95']:.4f} p99 {stats['p99']:.4f} sec")
+    for lag_name in ("pendingLag", "executedLag"):
+        lag = results["websocket"][lag_name]
+        if lag["count"]:
+            LOGGER.info(f"WebSocket {lag_name}: p50 {lag['p50']:.4f} p95 {lag['p95']:.4f} p99 {lag['p99']:.4f} sec")
+
+    baseline = json.loads(Path(config.getoption("--bench-baseline")).read_text())
+    violations = check_thresholds(results, baseline)
+    assert not violations, f"Benchmark results are past baseline thresholds: {violations}"
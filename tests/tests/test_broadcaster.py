@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+broadcaster = pytest.importorskip("broadcaster", reason="server source is needed for Broadcaster unit tests")
+
+
+class StalledWebSocket:
+    """
+    Server side WebSocket of client that doesn't read: send blocks until `release`,
+    so published messages pile up in its send queue (real clients buffer frames, they never stall like this)
+    """
+
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, data: str) -> None:
+        await self.released.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.close_code = code
+
+    def release(self) -> None:
+        self.released.set()
+
+
+async def publish_to_stalled_client(policy: str, queue_size: int, count: int) -> tuple:
+    """Publish messages 1..count to stalled client, writer task holds message 1 and queue is filled by the rest"""
+    hub = broadcaster.Broadcaster(queue_size=queue_size, overflow_policy=policy)
+    websocket = StalledWebSocket()
+    client = hub.register(websocket)
+    hub.publish(1)
+    await asyncio.sleep(0)  # writer takes message 1 and blocks in send
+    for message in range(2, count + 1):
+        hub.publish(message)
+    return hub, websocket, client
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy, expected_sent", [
+    (broadcaster.OverflowPolicy.DROP_OLDEST, [1, 4, 5, 6]),
+    (broadcaster.OverflowPolicy.DROP_NEWEST, [1, 2, 3, 4]),
+])
+async def test_send_queue_overflow_drops_messages(policy, expected_sent):
+    """
+    1. publish 6 messages to stalled client with send queue of 3
+    2. assert 2 messages are dropped: the oldest or the newest ones by policy
+    3. release client, assert it gets the rest in order and stays connected
+    """
+    hub, websocket, client = await publish_to_stalled_client(policy, queue_size=3, count=6)
+    assert client.dropped == 2, "messages not fitting send queue should be dropped"
+    assert hub.queue_depths() == [3], "send queue should stay full"
+
+    websocket.release()
+    async with asyncio.timeout(5):
+        while len(websocket.sent) < len(expected_sent):
+            await asyncio.sleep(0.01)
+    assert websocket.sent == expected_sent, f"unexpected messages sent with {policy} policy"
+    assert hub.client_count == 1 and websocket.close_code is None, "client should stay connected"
+    hub.discard(websocket)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_send_queue_overflow_disconnects_client():
+    """
+    1. publish 5 messages to stalled client with send queue of 3
+    2. assert client is removed and closed with 1013 (try again later) on overflow
+    3. assert next messages are not sent to it
+    """
+    hub, websocket, client = await publish_to_stalled_client(broadcaster.OverflowPolicy.DISCONNECT, queue_size=3,
+                                                             count=5)
+    assert client.dropped == 1, "overflowing message should be dropped"
+    assert hub.client_count == 0, "overflowing client should be removed"
+    async with asyncio.timeout(5):
+        while websocket.close_code is None:
+            await asyncio.sleep(0.01)
+    assert websocket.close_code == 1013, "overflowing client should be closed with 1013"
+    assert hub.publish(6) == 0, "disconnected client should not get messages"
+    assert client.writer_task.cancelled() or client.writer_task.done(), "writer of disconnected client should stop"
+
+
+class ReadingWebSocket:
+    """Server side WebSocket of client that reads everything"""
+
+    async def send_text(self, data: str) -> None:
+        pass
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_unsubscribed_client_gets_only_explicit_all_updates():
+    """
+    1. subscribe client to stoks, then unsubscribe from it
+    2. assert client doesn't get messages anymore instead of getting all of them
+    3. subscribe client to all updates, assert it gets messages of any topic
+    """
+    hub = broadcaster.Broadcaster()
+    websocket = ReadingWebSocket()
+    hub.register(websocket)
+    assert hub.publish("update", ["stoks:EURUSD"]) == 1, "new client should get all messages"
+    hub.subscribe(websocket, ["stoks:USDJPY"])
+    assert hub.unsubscribe(websocket, ["stoks:USDJPY"]) == set()
+    assert hub.publish("update", ["stoks:EURUSD"]) == 0, "client unsubscribed from last topic should get nothing"
+    assert not hub.is_interested(websocket, ["stoks:EURUSD"])
+
+    hub.subscribe(websocket, [], all_updates=True)
+    hub.subscribe(websocket, ["position:EURUSD"])
+    assert hub.publish("update", ["stoks:EURUSD"]) == 1, "client subscribed to all should get all messages"
+    hub.unsubscribe(websocket, [], all_updates=True)
+    assert hub.publish("update", ["stoks:EURUSD"]) == 0, "client unsubscribed from all should get only its topics"
+    hub.discard(websocket)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_subscription_of_disconnected_client():
+    """
+    1. overflowing client is disconnected, its subscription message was already received
+    2. assert subscribe and unsubscribe ignore it instead of failing
+    """
+    hub, websocket, _ = await publish_to_stalled_client(broadcaster.OverflowPolicy.DISCONNECT, queue_size=3, count=5)
+    assert hub.subscribe(websocket, ["stoks:EURUSD"]) is None, "disconnected client should not be subscribed"
+    assert hub.unsubscribe(websocket) is None
+    assert hub.publish("update", ["stoks:EURUSD"]) == 0
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+os.environ["STORAGE"] = "memory"  # server module is imported by this test process, it must not connect to mongo
+main = pytest.importorskip("main", reason="server source is needed for order cache unit tests")
+from order_cache import OrderCache  # noqa: E402
+from positions import MemoryPositionStore  # noqa: E402
+from storage import MemoryOrderRepository  # noqa: E402
+
+
+class PausedReadRepository(MemoryOrderRepository):
+    """Memory storage which holds `get` after reading until `resume` is set, like slow read from mongo"""
+
+    def __init__(self):
+        super().__init__()
+        self.reading = asyncio.Event()
+        self.resume = asyncio.Event()
+
+    async def get(self, order_id: str):
+        order = await super().get(order_id)
+        self.reading.set()
+        await self.resume.wait()
+        return order
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Server module with own storage, cache and positions, endpoints are called as functions"""
+    monkeypatch.setattr(main, "orders_repository", PausedReadRepository())
+    monkeypatch.setattr(main, "order_cache", OrderCache())
+    monkeypatch.setattr(main, "position_store", MemoryPositionStore())
+    return main
+
+
+async def create_pending_order(server) -> str:
+    order_id = "cache-race-order"
+    await server.orders_repository.insert({"orderId": order_id, "stoks": "EURUSD", "quantity": 1.0,
+                                           "orderStatus": "pending", "version": 1,
+                                           "createdAt": datetime.now(timezone.utc)})
+    return order_id
+
+
+@pytest.mark.unit
+def test_cache_keeps_newer_version():
+    """
+    1. put order version 2 to cache, then version 1
+    2. assert version 2 stays cached
+    """
+    cache = OrderCache()
+    cache.put({"orderId": "order", "orderStatus": "canceled"}, 2)
+    cache.put({"orderId": "order", "orderStatus": "pending"}, 1)
+    assert cache.get("order") == ({"orderId": "order", "orderStatus": "canceled"}, 2), \
+        "older version should not replace cached newer one"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cache_miss_read_racing_with_cancel(server):
+    """
+    1. start GET of not cached order, hold it after storage read
+    2. cancel order meanwhile, then let GET finish and cache what it read
+    3. assert next GET returns canceled order, not pending one read before cancel
+    """
+    order_id = await create_pending_order(server)
+    read = asyncio.create_task(server.get_order(order_id, None))
+    await server.orders_repository.reading.wait()
+    await server.cancel_order(order_id)
+    server.orders_repository.resume.set()
+    await read
+
+    response = await server.get_order(order_id, None)
+    assert json.loads(response.body)["orderStatus"] == "canceled", "pending order read before cancel was cached"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_etag_after_cache_miss_read_racing_with_cancel(server):
+    """
+    1. GET not cached order with If-None-Match of version 1, hold it after storage read, cancel order meanwhile
+    2. assert racing GET answers with version it read
+    3. assert next GET with ETag of version 1 gets canceled order and ETag of version 2, not 304
+    """
+    order_id = await create_pending_order(server)
+    old_etag = server.order_etag(order_id, 1)
+    read = asyncio.create_task(server.get_order(order_id, old_etag))
+    await server.orders_repository.reading.wait()
+    await server.cancel_order(order_id)
+    server.orders_repository.resume.set()
+    racing_response = await read
+    assert racing_response.status_code == 304 and racing_response.headers["ETag"] == old_etag, \
+        "racing GET should answer with version read before cancel"
+
+    response = await server.get_order(order_id, old_etag)
+    assert response.status_code == 200, "304 returned for order changed since ETag"
+    assert response.headers["ETag"] == server.order_etag(order_id, 2), "ETag should be of canceled order version"
+    assert json.loads(response.body)["orderStatus"] == "canceled"
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+positions = pytest.importorskip("positions", reason="server source is needed for positions unit tests")
+from storage import MemoryOrderRepository  # noqa: E402
+
+
+def order(order_id: str, stoks: str, quantity: float, status: str) -> dict:
+    return {"orderId": order_id, "stoks": stoks, "quantity": quantity, "orderStatus": status, "version": 1,
+            "createdAt": datetime.now(timezone.utc)}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_rebuild_positions_fixes_drifted_view():
+    """
+    1. build positions view of orders, then change orders without view (like test data written to db directly)
+    2. rebuild view
+    3. assert positions are computed from current orders, positions of stoks without orders are removed
+    """
+    repository = MemoryOrderRepository()
+    await repository.insert(order("1", "EURUSD", 10, "pending"))
+    await repository.insert(order("2", "USDJPY", 5, "executed"))
+    store = positions.MemoryPositionStore()
+    await store.initialize(repository)
+    # order changes not applied to view: pending order canceled, USDJPY order deleted, new executed order added
+    await repository.compare_and_set_status("1", ["pending"], "canceled")
+    del repository.orders["2"]
+    await repository.insert(order("3", "EURUSD", 2.5, "executed"))
+
+    assert sorted(await store.rebuild(repository)) == ["EURUSD"]
+    rebuilt = positions.serialize_position(await store.get("EURUSD"))
+    assert (rebuilt["pendingOrders"], rebuilt["pendingQuantity"]) == (0, 0.0), "pending orders should be recomputed"
+    assert (rebuilt["canceledOrders"], rebuilt["canceledQuantity"]) == (1, 10.0), "canceled orders should be recomputed"
+    assert (rebuilt["executedOrders"], rebuilt["executedQuantity"]) == (1, 2.5), "executed orders should be recomputed"
+    assert await store.get("USDJPY") is None, "position of stoks without orders should be removed"
+
+
+class FailingPositionStore(positions.MemoryPositionStore):
+    """Positions view which can't be updated, like mongo not answering `$inc`"""
+
+    async def apply(self, changes):
+        raise ConnectionError("positions view is not available")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_order_changes_survive_failed_positions_update(monkeypatch):
+    """
+    1. create and cancel orders while positions view can't be updated
+    2. assert orders are created, submitted for execution, cached and canceled anyway
+    3. assert failed view updates are counted
+    """
+    os.environ["STORAGE"] = "memory"  # server module is imported by this test process, it must not connect to mongo
+    main = pytest.importorskip("main", reason="server source is needed for positions unit tests")
+    from executor import OrderExecutor
+    from order_cache import OrderCache
+    monkeypatch.setattr(main, "orders_repository", MemoryOrderRepository())
+    monkeypatch.setattr(main, "order_cache", OrderCache())
+    monkeypatch.setattr(main, "position_store", FailingPositionStore())
+    monkeypatch.setattr(main, "executor", OrderExecutor(main.process_order))
+    failures_before = main.position_update_failures.value
+
+    response = await main.create_order(main.CreateOrderRequest(stoks="EURUSD", quantity=1))
+    order_id = main.executor.queue.get_nowait()
+    assert response.headers["ETag"] == main.order_etag(order_id, 1), "order should be created and submitted for execution"
+    await main.cancel_order(order_id)
+    assert (await main.orders_repository.get(order_id))["orderStatus"] == "canceled", "order should be canceled"
+    assert main.order_cache.get(order_id)[0]["orderStatus"] == "canceled", "cache should have canceled order"
+    assert main.position_update_failures.value - failures_before == 2, "failed view updates should be counted"
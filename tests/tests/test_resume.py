@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+os.environ["STORAGE"] = "memory"  # server module is imported by this test process, it must not connect to mongo
+main = pytest.importorskip("main", reason="server source is needed for resume unit tests")
+from broadcaster import Broadcaster  # noqa: E402
+from replay import ReplayBuffer  # noqa: E402
+
+
+class RecordingWebSocket:
+    """Server side WebSocket remembering sent messages"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(json.loads(data))
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Server module with send queues of 5 messages and replay buffer of 100 updates"""
+    monkeypatch.setattr(main, "broadcaster", Broadcaster(queue_size=5))
+    monkeypatch.setattr(main, "replay_buffer", ReplayBuffer(size=100))
+    return main
+
+
+async def resume_after_updates(server, updates_count: int) -> list:
+    """Record updates, then resume new client from before them, returns messages client got"""
+    for index in range(updates_count):
+        server.replay_buffer.record({"orderId": str(index), "orderStatus": "pending"}, [])
+    websocket = RecordingWebSocket()
+    server.broadcaster.register(websocket)
+    server.resume_updates(websocket, 0, server.replay_buffer.stream_id)
+    await asyncio.sleep(0.01)  # writer sends enqueued messages
+    server.broadcaster.discard(websocket)
+    return websocket.sent
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_resume_replays_updates_fitting_send_queue(server):
+    """
+    1. resume client that missed 4 updates, send queue is 5 messages
+    2. assert client gets `resumed` and all 4 updates in order
+    """
+    sent = await resume_after_updates(server, 4)
+    assert sent[0]["action"] == "resumed" and sent[0]["replayed"] == 4
+    assert [update["seq"] for update in sent[1:]] == [1, 2, 3, 4], "missed updates should be replayed in order"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_resume_with_more_updates_than_send_queue_resyncs(server):
+    """
+    1. resume client that missed 10 updates, send queue is 5 messages
+    2. assert client is told to resync, instead of losing updates that don't fit its queue
+    """
+    sent = await resume_after_updates(server, 10)
+    assert sent == [{"action": "resync", "streamId": server.replay_buffer.stream_id, "seq": 10}], \
+        "replay not fitting send queue should be replaced by resync"
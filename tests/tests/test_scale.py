@@ -0,0 +1,56 @@
+import json
+import logging
+import time
+
+import pytest
+from helpers.api_helpers import get_orders
+
+LOGGER = logging.getLogger(__name__)
+
+
+@pytest.mark.scale
+def test_paginate_filtered_orders_at_scale(api_client, order_status, scale_orders):
+    """
+    1. generate big collection of orders
+    2. go through all pages of executed orders of the most popular stoks
+    3. assert every matching order returned once, sorted by orderId
+    """
+    stoks = max(scale_orders.stoks_weights, key=scale_orders.stoks_weights.get)
+    params = {"stoks": stoks, "status": order_status.EXECUTED, "limit": 1000}
+    order_ids = []
+    pages = 0
+    start = time.perf_counter()
+    while True:
+        page_response = get_orders(api_client, params=params)
+        assert page_response.status_code == 200, "response code should be 200 for page of orders"
+        pages += 1
+        page = page_response.json()
+        assert all(order["stoks"] == stoks and order["orderStatus"] == order_status.EXECUTED for order in page), \
+            "page has orders not matching filters"
+        order_ids.extend(order["orderId"] for order in page)
+        if "X-Next-Cursor" not in page_response.headers:
+            break
+        params["after"] = page_response.headers["X-Next-Cursor"]
+    LOGGER.info(f"{len(order_ids)} orders in {pages} pages got in {time.perf_counter() - start:.2f} sec")
+
+    assert len(order_ids) == scale_orders.by_stoks_status[(stoks, order_status.EXECUTED)], \
+        "not every matching order returned"
+    assert order_ids == sorted(set(order_ids)), "orders should be sorted by orderId without duplicates"
+
+
+@pytest.mark.scale
+def test_stream_orders_created_in_window_at_scale(api_client, scale_orders):
+    """
+    1. generate big collection of orders
+    2. stream orders of every stoks created in time window as ndjson
+    3. assert number of streamed orders is number of generated orders in window
+    """
+    for stoks in scale_orders.stoks_weights:
+        params = {"stoks": stoks, "createdFrom": scale_orders.window_from.isoformat(),
+                  "createdTo": scale_orders.window_to.isoformat()}
+        start = time.perf_counter()
+        with get_orders(api_client, params=params, headers={"Accept": "application/x-ndjson"}, stream=True) as response:
+            assert response.status_code == 200, "response code should be 200 for ndjson stream"
+            count = sum(1 for line in response.iter_lines() if line and json.loads(line)["stoks"] == stoks)
+        LOGGER.info(f"{count} orders of {stoks} streamed in {time.perf_counter() - start:.2f} sec")
+        assert count == scale_orders.by_stoks_in_window[stoks], f"unexpected number of {stoks} orders in window"
@@ -2,14 +2,23 @@ import pytest
 import time
 import websockets
 import asyncio
-from helpers.api_helpers import create_order, cancel_order, async_create_order
+from helpers.api_helpers import create_order, cancel_order, async_create_order, create_orders_batch, get_order
+from helpers.ws_helpers import wait_for_order_messages, wait_for_order_frame, wait_for_reply
 from statistics import mean, stdev
 import json
 import logging
+import msgpack
+from uuid import uuid4
 
 LOGGER = logging.getLogger(__name__)
 
 
+def without_seq(update: dict) -> dict:
+    """Order update without sequence number, which depends on updates of other tests"""
+    assert isinstance(update.get("seq"), int), "order update should have sequence number"
+    return {key: value for key, value in update.items() if key != "seq"}
+
+
 @pytest.mark.websockets
 @pytest.mark.asyncio
 async def test_websocket_order_updates(api_client, order_status, ws_url):
@@ -24,15 +33,10 @@ async def test_websocket_order_updates(api_client, order_status, ws_url):
         assert order_response.status_code == 201, "create valid order not returned status 201 code"
         order_id = order_response.json()["orderId"]
 
-        # First message: Order created with status PENDING
-        pending_message = json.loads(await websocket.recv())
-        assert pending_message["orderId"] == order_id, "unexpected orderId! Check if this test isolated"
-        assert pending_message["orderStatus"] == order_status.PENDING, f"orderStatus should be {order_status.PENDING} for new order! Check if this test isolated"
-
-        # Second message: Order executed
-        executed_message = json.loads(await websocket.recv())
-        assert executed_message["orderId"] == order_id, "unexpected orderId! Check if this test isolated! Check if this test isolated"
-        assert executed_message["orderStatus"] == order_status.EXECUTED, f"orderStatus should be {order_status.EXECUTED} for new order! Check if this test isolated"
+        # First message: Order created with status PENDING, second message: Order executed
+        pending_message, executed_message = await wait_for_order_messages(websocket, order_id, count=2)
+        assert pending_message["orderStatus"] == order_status.PENDING, f"orderStatus should be {order_status.PENDING} for new order!"
+        assert executed_message["orderStatus"] == order_status.EXECUTED, f"orderStatus should be {order_status.EXECUTED} for new order!"
 
 
 @pytest.mark.websockets
@@ -46,9 +50,206 @@ async def test_websocket_order_cancel(pending_order_data_fixture, api_client, or
     async with websockets.connect(ws_url) as websocket:
         cancel_order_response = cancel_order(api_client, pending_order_data_fixture['orderId'])
         assert cancel_order_response.status_code == 204, "cancel cancellable order not returned status 204!"
-        cancel_message = json.loads(await websocket.recv())
-        assert cancel_message["orderId"] == pending_order_data_fixture['orderId'], "unexpected orderId! Check if this test isolated! Check if this test isolated"
-        assert cancel_message["orderStatus"] == order_status.CANCELED, f"orderStatus should be {order_status.CANCELED} after cancel {order_status.PENDING} order! Check if this test isolated"
+        cancel_message, = await wait_for_order_messages(websocket, pending_order_data_fixture['orderId'])
+        assert cancel_message["orderStatus"] == order_status.CANCELED, f"orderStatus should be {order_status.CANCELED} after cancel {order_status.PENDING} order!"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_update_delivered_to_all_clients(api_client, order_status, ws_url):
+    """
+    1. Connect several WebSocket clients.
+    2. Create a new order.
+    3. Validate every client got PENDING message.
+    Clients that don't read are covered by send queue overflow tests in test_broadcaster.py.
+    """
+    async with websockets.connect(ws_url) as first_websocket, websockets.connect(ws_url) as second_websocket:
+        order_response = create_order(api_client, stoks="EURUSD", quantity=100.5)
+        assert order_response.status_code == 201, "create valid order not returned status 201 code"
+        order_id = order_response.json()["orderId"]
+
+        for websocket in (first_websocket, second_websocket):
+            pending_message, = await wait_for_order_messages(websocket, order_id)
+            assert without_seq(pending_message) == {"orderId": order_id, "orderStatus": order_status.PENDING}, \
+                "unexpected message!"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_subscription_by_stoks(api_client, order_status, ws_url):
+    """
+    1. Subscribe to updates of orders with unique stoks.
+    2. Create order with other stoks and order with subscribed stoks.
+    3. Validate only updates of subscribed stoks were received.
+    """
+    subscribed_stoks = f"SUB{uuid4().hex[:8].upper()}"
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(json.dumps({"action": "subscribe", "stoks": [subscribed_stoks]}))
+        subscribed_message = await wait_for_reply(websocket)  # updates sent before subscription are skipped
+        assert subscribed_message == {"action": "subscribed", "all": False, "orderIds": [], "stoks": [subscribed_stoks],
+                                      "orderStatuses": [], "positions": []}, "unexpected subscription confirmation"
+
+        other_order_response = create_order(api_client, stoks="EURUSD", quantity=100.5)
+        assert other_order_response.status_code == 201, "create valid order not returned status 201 code"
+        order_response = create_order(api_client, stoks=subscribed_stoks, quantity=100.5)
+        assert order_response.status_code == 201, "create valid order not returned status 201 code"
+        order_id = order_response.json()["orderId"]
+
+        pending_message = json.loads(await websocket.recv())
+        assert without_seq(pending_message) == {"orderId": order_id, "orderStatus": order_status.PENDING}, \
+            "update of not subscribed stoks received!"
+        executed_message = json.loads(await websocket.recv())
+        assert without_seq(executed_message) == {"orderId": order_id, "orderStatus": order_status.EXECUTED}, \
+            "update of not subscribed stoks received!"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_position_subscription(api_client, order_status, ws_url):
+    """
+    1. Subscribe to position of unique stoks.
+    2. Create order with this stoks.
+    3. Validate only position changes are received: order is pending, then executed.
+    """
+    subscribed_stoks = f"POS{uuid4().hex[:8].upper()}"
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(json.dumps({"action": "subscribe", "positions": [subscribed_stoks]}))
+        subscribed_message = await wait_for_reply(websocket)
+        assert subscribed_message["positions"] == [subscribed_stoks], "unexpected subscription confirmation"
+
+        order_response = create_order(api_client, stoks=subscribed_stoks, quantity=2.5)
+        assert order_response.status_code == 201, "create valid order not returned status 201 code"
+
+        pending_message = json.loads(await websocket.recv())
+        assert "orderId" not in pending_message, "client subscribed to position should not get order updates"
+        position = pending_message["position"]
+        assert position["stoks"] == subscribed_stoks, "position of not subscribed stoks received!"
+        if position["executedOrders"] == 0:  # changes of one stoks can be pushed as one
+            assert (position["pendingOrders"], position["pendingQuantity"]) == (1, 2.5), "new order should be pending"
+            position = json.loads(await websocket.recv())["position"]
+        assert (position["pendingOrders"], position["executedOrders"], position["executedQuantity"]) == (0, 1, 2.5), \
+            "executed order should be moved to executed in position"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+@pytest.mark.parametrize("message", ["not a json", json.dumps({"stoks": ["EURUSD"]}),
+                                     json.dumps({"action": "something"}),
+                                     json.dumps({"action": "subscribe", "stoks": "EURUSD"}),
+                                     json.dumps({"action": "subscribe", "orderIds": [1, 2]}),
+                                     json.dumps({"action": "unsubscribe", "positions": {"stoks": "EURUSD"}}),
+                                     json.dumps({"action": "subscribe", "all": "yes"})])
+async def test_websocket_invalid_subscription_message(ws_url, message):
+    """
+    1. Send invalid subscription message.
+    2. Validate error message received.
+    """
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(message)
+        error_message = await wait_for_reply(websocket)
+        assert "error" in error_message, "error should be returned for invalid subscription message"
+        await websocket.send(json.dumps({"action": "subscribe"}))
+        subscription = await wait_for_reply(websocket)
+        assert all(values == [] for key, values in subscription.items() if key not in ("action", "all")), \
+            "invalid subscription message should not subscribe to anything"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_orders_batch_single_frame(api_client, order_status, ws_url):
+    """
+    1. Start listening to WebSocket.
+    2. Create batch of orders.
+    3. Validate PENDING updates of all orders came in one frame.
+    4. Validate every order of batch is executed, EXECUTED updates come one per frame.
+    """
+    async with websockets.connect(ws_url) as websocket:
+        batch_response = create_orders_batch(api_client, [{"stoks": "EURUSD", "quantity": 1} for _ in range(5)])
+        assert batch_response.status_code == 200, "create valid batch not returned status 200 code"
+        order_ids = [order["orderId"] for order in batch_response.json()]
+
+        batch_message = await wait_for_order_frame(websocket, order_ids)
+        assert [without_seq(update) for update in batch_message] == [{"orderId": order_id, "orderStatus": order_status.PENDING} for order_id in order_ids], \
+            "unexpected batch message!"
+        seqs = [update["seq"] for update in batch_message]
+        assert seqs == list(range(seqs[0], seqs[0] + len(seqs))), "updates of batch should have consecutive seq"
+
+        # orders of batch are executed one by one
+        executed_ids = set()
+        while executed_ids != set(order_ids):
+            executed_message = await wait_for_order_frame(websocket, set(order_ids) - executed_ids)
+            assert isinstance(executed_message, dict), "execution of order should be sent as separate update"
+            assert executed_message["orderStatus"] == order_status.EXECUTED, "unexpected message!"
+            executed_ids.add(executed_message["orderId"])
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_msgpack_subprotocol(api_client, order_status, ws_url):
+    """
+    1. Connect with msgpack subprotocol and subscribe to orders with unique stoks.
+    2. Create order with subscribed stoks.
+    3. Validate updates came as msgpack binary frames.
+    """
+    subscribed_stoks = f"MSG{uuid4().hex[:8].upper()}"
+    async with websockets.connect(ws_url, subprotocols=["msgpack"]) as websocket:
+        assert websocket.subprotocol == "msgpack", "server should accept msgpack subprotocol"
+        await websocket.send(msgpack.packb({"action": "subscribe", "stoks": [subscribed_stoks]}))
+        subscribed_message = await wait_for_reply(websocket, decode=msgpack.unpackb)  # msgpack.unpackb fails on text frames
+        assert subscribed_message["stoks"] == [subscribed_stoks], "unexpected subscription confirmation"
+
+        order_response = create_order(api_client, stoks=subscribed_stoks, quantity=100.5)
+        assert order_response.status_code == 201, "create valid order not returned status 201 code"
+        order_id = order_response.json()["orderId"]
+
+        for expected_status in (order_status.PENDING, order_status.EXECUTED):
+            message = msgpack.unpackb(await websocket.recv())
+            assert without_seq(message) == {"orderId": order_id, "orderStatus": expected_status}, "unexpected msgpack message"
+
+
+@pytest.mark.websockets
+@pytest.mark.asyncio
+async def test_websocket_resume_replays_missed_updates(api_client, order_status, ws_url):
+    """
+    1. Subscribe to orders with unique stoks and remember seq of PENDING update.
+    2. Disconnect, wait for order execution while disconnected.
+    3. Reconnect, subscribe and resume from remembered seq.
+    4. Validate missed EXECUTED update was replayed, and unknown stream requires resync.
+    """
+    subscribed_stoks = f"RES{uuid4().hex[:8].upper()}"
+    subscribe_message = json.dumps({"action": "subscribe", "stoks": [subscribed_stoks]})
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(subscribe_message)
+        await wait_for_reply(websocket)  # subscription confirmation
+        order_response = create_order(api_client, stoks=subscribed_stoks, quantity=100.5)
+        assert order_response.status_code == 201, "create valid order not returned status 201 code"
+        order_id = order_response.json()["orderId"]
+        pending_message = json.loads(await websocket.recv())
+        assert without_seq(pending_message) == {"orderId": order_id, "orderStatus": order_status.PENDING}, \
+            "unexpected message!"
+        await websocket.send(json.dumps({"action": "resume"}))
+        stream_id = (await wait_for_reply(websocket))["streamId"]
+
+    for _ in range(50):  # wait for execution of order while client is disconnected
+        if get_order(api_client, order_id).json()["orderStatus"] == order_status.EXECUTED:
+            break
+        await asyncio.sleep(0.1)
+
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(subscribe_message)
+        await wait_for_reply(websocket)  # subscription confirmation
+        await websocket.send(json.dumps({"action": "resume", "lastSeq": pending_message["seq"], "streamId": stream_id}))
+        resumed_message = json.loads(await websocket.recv())
+        assert resumed_message["action"] == "resumed", "missed updates should be still in replay buffer"
+        assert resumed_message["replayed"] == 1, "only update of subscribed stoks should be replayed"
+        executed_message = json.loads(await websocket.recv())
+        assert without_seq(executed_message) == {"orderId": order_id, "orderStatus": order_status.EXECUTED}, \
+            "missed update was not replayed"
+        assert executed_message["seq"] > pending_message["seq"], "seq of updates should increase"
+
+        await websocket.send(json.dumps({"action": "resume", "lastSeq": 0, "streamId": "unknown"}))
+        resync_message = json.loads(await websocket.recv())
+        assert resync_message["action"] == "resync", "updates of unknown stream can not be replayed"
 
 
 @pytest.mark.asyncio
@@ -77,8 +278,8 @@ async def test_websocket_performance(async_api_client, ws_url, order_status):
         await asyncio.gather(*tasks)
 
         execution_times = []
-        for _ in range(200):  # Expecting 2 messages per order
-            message = json.loads(await websocket.recv())
+        while len(execution_times) < len(order_ids):  # Expecting 2 messages per order, updates of other tests skipped
+            message, = await wait_for_order_messages(websocket, order_ids, timeout=30)
             ws_order_id = message["orderId"]
             ws_order_status = message["orderStatus"]
 